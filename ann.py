@@ -0,0 +1,151 @@
+"""
+Approximate nearest-neighbour candidate generation for large FAQ corpora.
+
+Exports:
+  LSHIndex — sign-random-projection LSH tables over fused glyph vectors
+             with multi-probe lookup
+  recall_report(index, queries, k, probes) — recall@k vs latency against
+                                            exact FAQIndex search
+  tune_probes(index, queries, target_recall, k) — smallest probe count that
+                                                 reaches a recall target
+
+The fused vectors (see index.fuse_roles) turn the Pattern A score into a
+single dot product, so the angle between fused vectors is what a random
+hyperplane hash approximates. Each table hashes a vector to the sign pattern
+of n_bits random projections; entries in the query's bucket (and, with
+multi-probe, in the buckets one bit-flip away along the least confident
+projections) become the candidate set that FAQIndex then scores exactly.
+"""
+
+import time
+
+import numpy as np
+
+
+class LSHIndex:
+    """Sign-random-projection LSH over the rows of a fused matrix."""
+
+    def __init__(self, fused: np.ndarray, n_tables: int = 8,
+                 n_bits: int | None = None, n_probes: int = 2, seed: int = 42):
+        n, width = fused.shape
+        if n_bits is None:
+            # Aim for ~8 entries per bucket, within sane bounds.
+            n_bits = int(np.clip(np.log2(max(n, 1) / 8), 4, 24))
+        self.n_tables = n_tables
+        self.n_bits   = n_bits
+        self.n_probes = n_probes
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, width, n_bits)).astype(np.float32)
+        self._weights = (1 << np.arange(n_bits, dtype=np.int64))
+        self.tables: list[dict[int, np.ndarray]] = [
+            self._bucketize(self._codes(fused, t)) for t in range(n_tables)
+        ]
+
+    def _codes(self, vectors: np.ndarray, table: int) -> np.ndarray:
+        return ((vectors @ self.planes[table]) >= 0).astype(np.int64) @ self._weights
+
+    @staticmethod
+    def _bucketize(codes: np.ndarray) -> dict[int, np.ndarray]:
+        order = np.argsort(codes, kind="stable")
+        keys, starts = np.unique(codes[order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+        return {int(k): order[s:e] for k, s, e in zip(keys, starts, bounds)}
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """Hash one more (or one changed) row into every table.
+
+        A changed row keeps its old buckets too; the extra candidates are
+        filtered out by exact scoring, and FAQIndex.compact() rebuilds.
+        """
+        for t, buckets in enumerate(self.tables):
+            code   = int(self._codes(vector[None, :], t)[0])
+            bucket = buckets.get(code)
+            if bucket is None:
+                buckets[code] = np.array([row], dtype=np.int64)
+            elif row not in bucket:
+                buckets[code] = np.append(bucket, row)
+
+    def candidates(self, q_fused: np.ndarray, n_probes: int | None = None) -> np.ndarray:
+        """Sorted unique rows hashed near q_fused in any table."""
+        probes = self.n_probes if n_probes is None else n_probes
+        found: list[np.ndarray] = []
+        for t, buckets in enumerate(self.tables):
+            proj = q_fused @ self.planes[t]
+            code = int(((proj >= 0).astype(np.int64)) @ self._weights)
+            keys = [code] + [
+                code ^ (1 << int(b)) for b in np.argsort(np.abs(proj))[:probes]
+            ]
+            found.extend(buckets[k] for k in keys if k in buckets)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+
+# ---------------------------------------------------------------------------
+# Recall vs latency
+# ---------------------------------------------------------------------------
+
+def recall_report(index, queries: list[str], k: int = 3,
+                  probes: tuple[int, ...] = (0, 1, 2, 4, 8)) -> list[dict]:
+    """Recall@k and mean latency of the ANN backend against exact search.
+
+    `index` is a FAQIndex with an LSH backend attached; the exact reference
+    is computed on the same index with the backend switched off. Queries
+    with fewer than min_candidates ANN candidates fall back to a full scan
+    in candidates(); they are counted in `fallback_rate` and left out of
+    `recall`, which only measures answers the ANN candidates produced.
+    """
+    ann, index.ann = index.ann, None
+    try:
+        exact, exact_ms = [], 0.0
+        for q in queries:
+            start = time.perf_counter()
+            exact.append({m["question_id"] for _, m in index.search(q, top_k=k)})
+            exact_ms += (time.perf_counter() - start) * 1000
+    finally:
+        index.ann = ann
+
+    rows = []
+    default_probes = ann.n_probes
+    try:
+        for n_probes in probes:
+            ann.n_probes = n_probes
+            hits, total, cands, fallbacks, elapsed = 0, 0, 0, 0, 0.0
+            for q, truth in zip(queries, exact):
+                start = time.perf_counter()
+                got = {m["question_id"] for _, m in index.search(q, top_k=k)}
+                elapsed += (time.perf_counter() - start) * 1000
+                cand = index.candidates(q, index.encode_query(q), fallback=False)
+                if cand is not None and len(cand) < max(index.min_candidates, 1):
+                    fallbacks += 1
+                    cands += len(index)
+                    continue
+                hits  += len(got & truth)
+                total += len(truth)
+                cands += len(index) if cand is None else len(cand)
+            rows.append({
+                "n_probes":         n_probes,
+                "recall":           hits / total if total else 0.0,
+                "fallback_rate":    fallbacks / len(queries) if queries else 0.0,
+                "mean_candidates":  cands / len(queries) if queries else 0.0,
+                "latency_mean_ms":  elapsed / len(queries) if queries else 0.0,
+                "exact_mean_ms":    exact_ms / len(queries) if queries else 0.0,
+            })
+    finally:
+        ann.n_probes = default_probes
+    return rows
+
+
+def tune_probes(index, queries: list[str], target_recall: float = 0.95,
+                k: int = 3) -> dict:
+    """Set index.ann.n_probes to the smallest value reaching target_recall.
+
+    Recall excludes full-scan fallbacks (see recall_report()), so a probe
+    count can't reach the target through exact fallbacks alone. Falls back
+    to probing every bit when the target is never reached. Returns the
+    report row for the chosen setting.
+    """
+    report = recall_report(index, queries, k, tuple(range(index.ann.n_bits + 1)))
+    chosen = next((r for r in report if r["recall"] >= target_recall), report[-1])
+    index.ann.n_probes = chosen["n_probes"]
+    return chosen
@@ -16,21 +16,40 @@ Usage:
     python benchmark/run.py
     python benchmark/run.py --threshold 0.45
     python benchmark/run.py --output benchmark/results/
+    python benchmark/run.py --mode fused
+    python benchmark/run.py --prune
+    python benchmark/run.py --route
+    python benchmark/run.py --route --route-margin 1
+    python benchmark/run.py --batch
+    python benchmark/run.py --bounded
+    python benchmark/run.py --ann --ann-report
+    python benchmark/run.py --hierarchical
+    python benchmark/run.py --query-cache 1024 --result-cache 1024
+    python benchmark/run.py --codebook
+    python benchmark/run.py --word-table
+    python benchmark/run.py --typeahead-report
+    python benchmark/run.py --index faq.index
+    python benchmark/run.py --shards 4 --shard-by category
+    python benchmark/run.py --replicas 4
 """
 
 import argparse
 import json
 import sys
+import tempfile
 import time
 from pathlib import Path
 from typing import Any
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from encoder import ENCODER_CONFIG, encode_query, entry_to_record
-from glyphh.core.types import Concept
-from glyphh.core.ops import cosine_similarity
+from encoder import ENCODER_CONFIG, entry_to_record
 from glyphh.encoder import Encoder
+from ann import recall_report
+from typeahead import typeahead_report
+from index import ROLE_WEIGHTS, FAQIndex, encode_record
+from shard import ReplicaPool, ShardedIndex, build_shards
+from store import data_digest, load_or_build, write_index
 
 BENCHMARK_DIR = Path(__file__).parent
 QUERIES_PATH  = BENCHMARK_DIR / "queries.json"
@@ -38,83 +57,141 @@ DATA_PATH     = BENCHMARK_DIR.parent / "data" / "faq.jsonl"
 
 DEFAULT_THRESHOLD = 0.40
 
-# Pattern A role weights — must match test_similarity.py
-ROLE_WEIGHTS = {
-    "question": 1.0,
-    "category": 0.6,
-    "keywords": 0.8,
-    "answer":   0.4,
-}
-
 
 # ═══════════════════════════════════════════════════════════════
 # FAQ Matcher
 # ═══════════════════════════════════════════════════════════════
 
 class FAQMatcher:
-    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, mode: str = "roles",
+                 prune: bool = False, route: bool = False, route_margin: int = 0, bounded: bool = False,
+                 ann: bool = False, hierarchical: bool = False, query_cache_size: int = 0,
+                 result_cache_size: int = 0, codebook: bool = False,
+                 word_table: bool = False, index_path: Path | None = None,
+                 shards: int = 0, shard_by: str = "hash", replicas: int = 0):
         self.threshold  = threshold
+        self.mode       = mode
+        self.prune      = prune
+        self.route      = route
+        self.route_margin = route_margin
+        self.bounded    = bounded
+        self.ann        = ann
+        self.hierarchical = hierarchical
+        self.query_cache_size  = query_cache_size
+        self.result_cache_size = result_cache_size
+        self.codebook          = codebook
+        self.word_table        = word_table
+        self.index_path        = index_path
+        self.shards            = shards
+        self.shard_by          = shard_by
+        self.replicas          = replicas
         self.encoder    = Encoder(ENCODER_CONFIG)
-        self.faq_glyphs: list[tuple[Any, dict]] = []
-        self._load_faq()
-
-    def _load_faq(self):
+        self.index      = self._load_faq()
+
+    def _load_faq(self) -> FAQIndex | ShardedIndex | ReplicaPool:
+        options = dict(
+            prune=self.prune, route=self.route, route_threshold=self.threshold,
+            route_margin=self.route_margin,
+            bounded=self.bounded, ann=self.ann, hierarchical=self.hierarchical,
+            query_cache_size=self.query_cache_size, result_cache_size=self.result_cache_size,
+            codebook=self.codebook, word_table=self.word_table,
+        )
+        entries = []
         with open(DATA_PATH) as f:
             for line in f:
                 line = line.strip()
                 if not line:
                     continue
-                entry  = json.loads(line)
-                record = entry_to_record(entry)
-                concept = Concept(
-                    name=record["attributes"]["question_id"],
-                    attributes=record["attributes"],
+                entries.append(json.loads(line))
+        if self.replicas:
+            # Workers attach to one shared-memory copy of the snapshot.
+            path = self.index_path
+            if path is None:
+                path = Path(tempfile.mkdtemp(prefix="faq-index-")) / "faq.index"
+                built = FAQIndex.from_records(
+                    self.encoder, [entry_to_record(e) for e in entries], codebook=True,
+                    hierarchical=self.hierarchical,
                 )
-                glyph = self.encoder.encode(concept)
-                self.faq_glyphs.append((glyph, record["metadata"]))
-
-    def match(self, query: str) -> dict[str, Any]:
-        start   = time.perf_counter()
-        record  = encode_query(query)
-        q_concept = Concept(name=record["name"], attributes=record["attributes"])
-        q_glyph = self.encoder.encode(q_concept)
-
-        # Flatten query roles
-        q_roles: dict = {}
-        for layer in q_glyph.layers.values():
-            if layer.name.startswith("_"):
-                continue
-            for seg in layer.segments.values():
-                q_roles.update(seg.roles)
-
-        scores: list[tuple[float, dict]] = []
-        for faq_glyph, meta in self.faq_glyphs:
-            e_roles: dict = {}
-            for layer in faq_glyph.layers.values():
-                if layer.name.startswith("_"):
-                    continue
-                for seg in layer.segments.values():
-                    e_roles.update(seg.roles)
-
-            weighted_sum = 0.0
-            weight_total = 0.0
-            for rname, w in ROLE_WEIGHTS.items():
-                if rname in q_roles and rname in e_roles:
-                    sim = float(cosine_similarity(q_roles[rname].data, e_roles[rname].data))
-                    weighted_sum += sim * w
-                    weight_total += w
-
-            score = weighted_sum / weight_total if weight_total > 0 else 0.0
-            scores.append((score, meta))
-
-        scores.sort(key=lambda x: x[0], reverse=True)
+                write_index(built, path)
+            else:
+                load_or_build(
+                    self.encoder, path, lambda: [entry_to_record(e) for e in entries],
+                    data=data_digest(entries), hierarchical=self.hierarchical,
+                )
+            return ReplicaPool(self.encoder, path, self.replicas, self.mode, **options)
+        if self.index_path is not None:
+            # Reuses the snapshot unless config, preprocessing or data changed.
+            return load_or_build(
+                self.encoder, self.index_path, lambda: [entry_to_record(e) for e in entries],
+                self.mode, data=data_digest(entries), **options,
+            )
+        records = [entry_to_record(e) for e in entries]
+        if self.shards:
+            # Scatter-gather over worker processes; shard files are rebuilt per run.
+            glyphs   = [encode_record(self.encoder, r) for r in records]
+            directory = Path(tempfile.mkdtemp(prefix="faq-shards-"))
+            manifest = build_shards(self.encoder, glyphs, directory, self.shards, self.shard_by,
+                                    hierarchical=self.hierarchical)
+            options.pop("route")
+            options.pop("route_threshold")
+            return ShardedIndex(self.encoder, manifest, self.mode, route=self.route,
+                                route_threshold=self.threshold, **options)
+        return FAQIndex.from_records(self.encoder, records, ROLE_WEIGHTS, self.mode, **options)
+
+    def _editable(self) -> FAQIndex:
+        """The in-process FAQIndex, which upsert() and delete() edit."""
+        if not isinstance(self.index, FAQIndex):
+            raise TypeError(
+                f"{type(self.index).__name__} serves read-only index files from worker "
+                "processes; upsert() and delete() need a matcher without --shards or --replicas"
+            )
+        return self.index
+
+    def upsert(self, entry: dict) -> None:
+        """Add or replace one JSONL entry without reloading the corpus."""
+        self._editable().upsert(entry_to_record(entry))
+
+    def delete(self, question_id: str) -> bool:
+        return self._editable().delete(question_id)
+
+    def close(self) -> None:
+        """Stop shard or replica workers, if any."""
+        if isinstance(self.index, (ShardedIndex, ReplicaPool)):
+            self.index.close()
+
+    def match(self, query: str, top_k: int | None = None) -> dict[str, Any]:
+        k      = self.index.top_k if top_k is None else top_k
+        start  = time.perf_counter()
+        scores = self.index.search(query, top_k=max(k, 3))
         elapsed_ms = (time.perf_counter() - start) * 1000
-
+        result = self._result(scores, k, elapsed_ms)
+        if self.hierarchical:
+            result["stage_ms"] = dict(self.index.stage_ms)
+        return result
+
+    def match_many(self, queries: list[str], top_k: int | None = None) -> list[dict[str, Any]]:
+        """Match a batch of questions; latency_ms is the per-query share of the batch."""
+        k       = self.index.top_k if top_k is None else top_k
+        start   = time.perf_counter()
+        batches = self.index.search_many(queries, top_k=max(k, 3))
+        elapsed_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+        results = [self._result(scores, k, elapsed_ms) for scores in batches]
+        if self.hierarchical:
+            share = {s: ms / max(len(queries), 1) for s, ms in self.index.stage_ms.items()}
+            for result in results:
+                result["stage_ms"] = dict(share)
+        return results
+
+    def _result(self, scores: list[tuple[float, dict]], k: int, elapsed_ms: float) -> dict[str, Any]:
         top_score, top_meta = scores[0] if scores else (0.0, None)
         top_3 = [
             {"question_id": m["question_id"], "score": round(s, 4)}
             for s, m in scores[:3]
         ]
+        top_k_matches = [
+            {"question_id": m["question_id"], "score": round(s, 4)}
+            for s, m in scores[:k]
+        ]
 
         if top_score >= self.threshold and top_meta:
             return {
@@ -124,6 +201,7 @@ class FAQMatcher:
                 "confidence":  round(top_score, 4),
                 "latency_ms":  elapsed_ms,
                 "top_3":       top_3,
+                "top_k":       top_k_matches,
             }
         return {
             "question_id": None,
@@ -132,6 +210,7 @@ class FAQMatcher:
             "confidence":  round(top_score, 4),
             "latency_ms":  elapsed_ms,
             "top_3":       top_3,
+            "top_k":       top_k_matches,
         }
 
 
@@ -197,6 +276,13 @@ def _aggregate(results: list[dict]) -> dict:
             "accuracy": cat_correct / len(cat_results) if cat_results else 0.0,
         }
 
+    # ShardedIndex reports only its scatter time, not coarse/fine stages.
+    staged = [r["stage_ms"] for r in results if "coarse" in (r.get("stage_ms") or {})]
+    stage_means = {
+        stage: sum(st[stage] for st in staged) / len(staged)
+        for stage in ("coarse", "fine")
+    } if staged else {}
+
     return {
         "total":              total,
         "accuracy":           correct / total if total else 0.0,
@@ -210,6 +296,7 @@ def _aggregate(results: list[dict]) -> dict:
         "oos_total":          len(oos),
         "latency_mean_ms":    sum(latencies) / len(latencies) if latencies else 0.0,
         "latency_p95_ms":     sorted(latencies)[int(len(latencies) * 0.95)] if latencies else 0.0,
+        "stage_mean_ms":      stage_means,
         "categories":         cat_breakdown,
     }
 
@@ -229,6 +316,9 @@ def _print_report(agg: dict, raw: list[dict]):
     print(f"  {'Category accuracy':<30} {agg['category_accuracy']:>9.1%}")
     print(f"  {'Latency mean (ms)':<30} {agg['latency_mean_ms']:>9.1f}")
     print(f"  {'Latency p95 (ms)':<30} {agg['latency_p95_ms']:>9.1f}")
+    for stage, ms in agg["stage_mean_ms"].items():
+        label = f"{stage.capitalize()} stage mean (ms)"
+        print(f"  {label:<30} {ms:>9.2f}")
 
     print(f"\n  {'Category':<20} {'Acc':>8} {'n':>4}")
     print("  " + "-" * 34)
@@ -246,6 +336,25 @@ def _print_report(agg: dict, raw: list[dict]):
     print("\n" + "=" * W)
 
 
+def _print_ann_report(rows: list[dict]):
+    print("\n  LSH ANN — recall@3 vs latency (exact search as reference;")
+    print("  recall excludes queries that fell back to a full scan)")
+    print(f"\n  {'Probes':>6} {'Recall':>8} {'Fallback':>9} {'Cands':>8} {'ANN ms':>8} {'Exact ms':>9}")
+    print("  " + "-" * 53)
+    for r in rows:
+        print(f"  {r['n_probes']:>6} {r['recall']:>7.1%} {r['fallback_rate']:>8.1%} "
+              f"{r['mean_candidates']:>8.1f} {r['latency_mean_ms']:>8.2f} {r['exact_mean_ms']:>9.2f}")
+
+
+def _print_typeahead_report(report: dict):
+    print("\n  Typeahead — per-keystroke latency (every prefix of every query)")
+    print(f"\n  Keystrokes:          {report['keystrokes']}")
+    print(f"  Top-3 agreement:     {report['agreement']:.1%}")
+    print(f"  Session mean:        {report['session_mean_ms']:.3f} ms")
+    print(f"  Full search mean:    {report['search_mean_ms']:.3f} ms")
+    print(f"  Speedup:             {report['speedup']:.1f}x")
+
+
 def _progress(current: int, total: int):
     pct    = current / total if total else 0
     filled = int(30 * pct)
@@ -257,19 +366,34 @@ def _progress(current: int, total: int):
 # Main
 # ═══════════════════════════════════════════════════════════════
 
-def run_benchmark(threshold: float = DEFAULT_THRESHOLD, output_dir: str | None = None):
+def run_benchmark(threshold: float = DEFAULT_THRESHOLD, output_dir: str | None = None,
+                  mode: str = "roles", prune: bool = False, route: bool = False,
+                  route_margin: int = 0, batch: bool = False, bounded: bool = False, ann: bool = False,
+                  ann_report: bool = False, hierarchical: bool = False,
+                  query_cache_size: int = 0, result_cache_size: int = 0,
+                  codebook: bool = False, word_table: bool = False,
+                  typeahead: bool = False, index_path: Path | None = None,
+                  shards: int = 0, shard_by: str = "hash", replicas: int = 0):
     with open(QUERIES_PATH) as f:
         query_data = json.load(f)
     queries = query_data["queries"]
 
-    matcher = FAQMatcher(threshold=threshold)
-    print(f"Loaded {len(matcher.faq_glyphs)} FAQ entries, {len(queries)} benchmark queries")
-    print(f"Threshold: {threshold}\n")
+    matcher = FAQMatcher(threshold=threshold, mode=mode, prune=prune, route=route,
+                         route_margin=route_margin,
+                         bounded=bounded, ann=ann or ann_report, hierarchical=hierarchical,
+                         query_cache_size=query_cache_size, result_cache_size=result_cache_size,
+                         codebook=codebook, word_table=word_table, index_path=index_path,
+                         shards=shards, shard_by=shard_by, replicas=replicas)
+    print(f"Loaded {len(matcher.index)} FAQ entries, {len(queries)} benchmark queries")
+    print(f"Threshold: {threshold}  Index mode: {mode}  Token pruning: {prune}  Category routing: {route}\n")
+
+    if batch:
+        batch_results = matcher.match_many([q["query"] for q in queries])
 
     raw_results = []
     for qi, q in enumerate(queries):
         _progress(qi + 1, len(queries))
-        result = matcher.match(q["query"])
+        result = batch_results[qi] if batch else matcher.match(q["query"])
         scoring = score_result(result, q["expected_id"], q["expected_category"])
         raw_results.append({
             "query_id":        q["id"],
@@ -282,6 +406,7 @@ def run_benchmark(threshold: float = DEFAULT_THRESHOLD, output_dir: str | None =
             "confidence":      result["confidence"],
             "latency_ms":      result["latency_ms"],
             "top_3":           result["top_3"],
+            "stage_ms":        result.get("stage_ms"),
             **scoring,
         })
 
@@ -290,6 +415,24 @@ def run_benchmark(threshold: float = DEFAULT_THRESHOLD, output_dir: str | None =
     agg = _aggregate(raw_results)
     _print_report(agg, raw_results)
 
+    if query_cache_size:
+        st = matcher.index.query_cache.stats()
+        print(f"\n  Query cache: {st['hits']} hits, {st['misses']} misses, "
+              f"{st['evictions']} evictions (hit rate {st['hit_rate']:.1%})")
+
+    if result_cache_size:
+        st = matcher.index.result_cache.stats()
+        print(f"  Result cache: {st['hits']} hits, {st['misses']} misses, "
+              f"{st['evictions']} evictions (hit rate {st['hit_rate']:.1%})")
+
+    if ann_report:
+        _print_ann_report(recall_report(matcher.index, [q["query"] for q in queries]))
+
+    if typeahead:
+        _print_typeahead_report(typeahead_report(matcher.index, [q["query"] for q in queries]))
+
+    matcher.close()
+
     if output_dir:
         out_path = Path(output_dir)
         out_path.mkdir(parents=True, exist_ok=True)
@@ -303,6 +446,51 @@ if __name__ == "__main__":
     parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
                         help=f"Confidence threshold for a match (default: {DEFAULT_THRESHOLD})")
     parser.add_argument("--output", type=str, help="Directory to save raw JSON results")
+    parser.add_argument("--mode", choices=FAQIndex.MODES, default="roles",
+                        help="Index scoring mode (default: roles)")
+    parser.add_argument("--prune", action="store_true",
+                        help="Only score entries sharing a question/keyword token with the query")
+    parser.add_argument("--route", action="store_true",
+                        help="Score the inferred category's partition first")
+    parser.add_argument("--route-margin", type=int, default=0, metavar="HITS",
+                        help="With --route, use the top two categories (or a full scan) "
+                             "when the best leads by fewer signal hits (default: 0)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Score all queries together with match_many()")
+    parser.add_argument("--bounded", action="store_true",
+                        help="Skip remaining roles once an entry cannot reach the top-k")
+    parser.add_argument("--ann", action="store_true",
+                        help="Use LSH candidate generation before exact scoring")
+    parser.add_argument("--ann-report", action="store_true",
+                        help="Print LSH recall vs latency against exact search")
+    parser.add_argument("--hierarchical", action="store_true",
+                        help="Rank by layer cortex first, re-rank survivors at role level")
+    parser.add_argument("--query-cache", type=int, default=0, metavar="SIZE",
+                        help="LRU cache of encoded queries (default: off)")
+    parser.add_argument("--result-cache", type=int, default=0, metavar="SIZE",
+                        help="LRU cache of final match results (default: off)")
+    parser.add_argument("--codebook", action="store_true",
+                        help="Assemble query vectors from a precomputed word codebook")
+    parser.add_argument("--word-table", action="store_true",
+                        help="Pick candidates from the word x entry table before exact scoring")
+    parser.add_argument("--typeahead-report", action="store_true",
+                        help="Print per-keystroke latency of incremental typeahead scoring")
+    parser.add_argument("--index", type=Path, metavar="PATH",
+                        help="Open (or rebuild if stale) a build.py index snapshot")
+    parser.add_argument("--shards", type=int, default=0, metavar="N",
+                        help="Score N shards in worker processes and merge their top-k")
+    parser.add_argument("--shard-by", choices=("hash", "category"), default="hash",
+                        help="Shard key: hash of question_id or whole categories (default: hash)")
+    parser.add_argument("--replicas", type=int, default=0, metavar="N",
+                        help="Serve from N worker processes sharing one in-memory index")
     args = parser.parse_args()
 
-    run_benchmark(threshold=args.threshold, output_dir=args.output)
+    run_benchmark(threshold=args.threshold, output_dir=args.output, mode=args.mode,
+                  prune=args.prune, route=args.route, route_margin=args.route_margin,
+                  batch=args.batch,
+                  bounded=args.bounded, ann=args.ann, ann_report=args.ann_report,
+                  hierarchical=args.hierarchical, query_cache_size=args.query_cache,
+                  result_cache_size=args.result_cache, codebook=args.codebook,
+                  word_table=args.word_table, typeahead=args.typeahead_report,
+                  index_path=args.index, shards=args.shards, shard_by=args.shard_by,
+                  replicas=args.replicas)
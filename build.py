@@ -5,6 +5,8 @@ Build the FAQ helpdesk model from JSONL data files.
 Usage:
     python build.py
     python build.py --output path/to/output.glyphh
+    python build.py --index path/to/faq.index
+    python build.py --processes 8
 """
 
 import argparse
@@ -12,11 +14,16 @@ import json
 import sys
 from pathlib import Path
 
-from encoder import entry_to_record
+from glyphh.encoder import Encoder
+
+from encoder import ENCODER_CONFIG, entries_to_records
+from index import FAQIndex
+from store import data_digest, write_index
 
 MODEL_DIR = Path(__file__).parent
 DATA_DIR = MODEL_DIR / "data"
 DEFAULT_OUTPUT = MODEL_DIR / "faq.glyphh"
+DEFAULT_INDEX = MODEL_DIR / "faq.index"
 
 JSONL_FILES = [
     "faq.jsonl",
@@ -45,8 +52,10 @@ def load_all_jsonl(data_dir: Path) -> list[dict]:
     return entries
 
 
-def build(output_path: Path | None = None) -> None:
+def build(output_path: Path | None = None, index_path: Path | None = None,
+          processes: int = 0) -> None:
     output = output_path or DEFAULT_OUTPUT
+    index_out = index_path or DEFAULT_INDEX
 
     print("Loading JSONL data files...")
     entries = load_all_jsonl(DATA_DIR)
@@ -55,9 +64,16 @@ def build(output_path: Path | None = None) -> None:
         sys.exit(1)
 
     print(f"\nConverting {len(entries)} entries to records...")
-    records = [entry_to_record(e) for e in entries]
+    records = entries_to_records(entries, processes)
 
     print(f"Total records: {len(records)}")
+
+    print("\nEncoding entries and precomputing word codebook...")
+    index = FAQIndex.from_records(Encoder(ENCODER_CONFIG), records, codebook=True)
+    print(f"Codebook vocabulary: {len(index.codebook)} words")
+
+    write_index(index, index_out, data_digest(entries))
+    print(f"Wrote memory-mapped index: {index_out} ({index_out.stat().st_size:,} bytes)")
     print(f"\nReady to package as {output}")
     print("(Packaging requires the Glyphh runtime SDK)")
 
@@ -65,5 +81,8 @@ def build(output_path: Path | None = None) -> None:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Build FAQ helpdesk model")
     parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Worker processes for category inference on large corpora")
     args = parser.parse_args()
-    build(args.output)
+    build(args.output, args.index, args.processes)
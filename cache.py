@@ -0,0 +1,92 @@
+"""
+Query-side caches for the FAQ matcher.
+
+Exports:
+  LRUCache — bounded least-recently-used mapping with hit/miss/eviction counters
+  ResultCache — LRUCache of final match results bound to a corpus fingerprint
+  query_key(query) — canonical bag-of-words key for an encoded query
+
+The question and keywords roles of a query are bag-of-words bundles, so the
+encoded query depends only on the *set* of its keywords (or, for
+stopword-only queries, of its cleaned words) plus the inferred category.
+Paraphrases that differ only in word order, case, punctuation, repeated
+words or stopwords share a key and therefore a cache entry.
+
+ResultCache entries are only valid for the corpus and encoder config that
+produced them. The owning index binds the cache to its fingerprint, and a
+changed fingerprint drops every stored result.
+"""
+
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from intent import QueryAnalysis, analyze
+
+
+def query_key(query: str | QueryAnalysis) -> tuple:
+    """Canonical (sorted words, category) key, mirroring encode_query()."""
+    analysis = analyze(query)
+    words    = analysis.keywords or analysis.tokens
+    return (tuple(sorted(set(words))), analysis.category)
+
+
+class LRUCache:
+    """OrderedDict-backed LRU cache; maxsize <= 0 disables storage."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize   = maxsize
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "size":      len(self._data),
+            "maxsize":   self.maxsize,
+            "hits":      self.hits,
+            "misses":    self.misses,
+            "evictions": self.evictions,
+            "hit_rate":  self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache(LRUCache):
+    """LRUCache whose contents are tied to one corpus/config fingerprint."""
+
+    def __init__(self, maxsize: int = 1024):
+        super().__init__(maxsize)
+        self.fingerprint: str | None = None
+
+    def bind(self, fingerprint: str) -> None:
+        """Switch to `fingerprint`, dropping every entry if it changed."""
+        if fingerprint != self.fingerprint:
+            self.clear()
+            self.fingerprint = fingerprint
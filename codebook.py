@@ -0,0 +1,338 @@
+"""
+Per-word hypervector codebook for incremental bag-of-words encoding.
+
+Exports:
+  bow_words(text) — the word list Encoder._encode_bag_of_words() bundles
+  word_encoders(encoder) — the SDK morphology and character encoders it uses
+  WordCodebook — word → (lemma, bipolar word vector) cache that assembles
+                 bag-of-words and role vectors identical to Encoder.encode()
+  bundle_gain(m) — expected share of one word's signal left in an m-word bundle
+  WordEntryTable — sparse per-word contribution rows over an index's BoW roles
+
+Encoder._encode_bag_of_words() lowercases and strips the text, normalises
+each word through the morphology engine, deduplicates the lemmas, encodes
+each lemma with the character n-gram encoder and majority-bundles the
+result. Morphology normalisation dominates that cost and depends only on
+the word, so the codebook runs it once per vocabulary word. A query's BoW
+vector is then one int16 add per distinct lemma plus a sign.
+
+The same per-word vectors give a precomputable word × entry table: before
+the sign, a BoW role score is a sum of per-lemma dot products. The sign makes
+that decomposition approximate, so WordEntryTable serves as a candidate stage
+whose survivors are re-scored exactly. Survivors are only as good as the
+estimate: an entry the table ranks below the cut is never scored, even when
+its exact score would have been the best.
+"""
+
+import math
+import re
+
+import numpy as np
+
+from cache import LRUCache
+
+
+def bow_words(text: str) -> list[str]:
+    """Words the encoder keeps for bag-of-words encoding (before morphology)."""
+    words = re.sub(r"[^a-z0-9\s]", "", str(text).lower()).split()
+    return [w for w in words if len(w) > 1]
+
+
+def word_encoders(encoder) -> tuple:
+    """(morphology engine or None, character encoder) of an Encoder's BoW path."""
+    # Private SDK API: Encoder._encode_bag_of_words() builds word vectors with
+    # these two lazy getters in glyphh 2.6 (checked against 2.6.7). Keep every
+    # use behind this helper so an SDK rename only needs changing here.
+    return encoder._get_morphology_engine(), encoder._get_char_encoder()
+
+
+class WordCodebook:
+    """Word vectors for one Encoder, precomputed for a vocabulary and grown lazily.
+
+    Only corpus words grow the codebook. Query words it lacks are encoded
+    into the bounded `query_words` LRUCache instead (see query_vector()),
+    so arbitrary query text can't grow the shared vocabulary.
+    """
+
+    def __init__(self, encoder, query_cache_size: int = 1024):
+        self.encoder   = encoder
+        self.dimension = encoder.dimension
+        self.words: dict[str, tuple[str, np.ndarray]] = {}
+        self.query_words = LRUCache(query_cache_size)
+        self._morph, self._chars = word_encoders(encoder)
+        self._role_defs = {
+            role.name: role
+            for layer in encoder.config.layers
+            for seg in layer.segments
+            for role in seg.roles
+        }
+        self._symbols: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_texts(cls, encoder, texts) -> "WordCodebook":
+        """Build a codebook covering every BoW word in `texts`."""
+        codebook = cls(encoder)
+        for text in texts:
+            for word in bow_words(text):
+                codebook.word_vector(word)
+        return codebook
+
+    @classmethod
+    def from_records(cls, encoder, records: list[dict]) -> "WordCodebook":
+        """Build a codebook from entry_to_record() outputs' BoW attributes."""
+        codebook = cls(encoder)
+        for rec in records:
+            for rname in codebook.bow_roles():
+                for word in bow_words(rec["attributes"].get(rname, "")):
+                    codebook.word_vector(word)
+        return codebook
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def bow_roles(self) -> list[str]:
+        return [
+            name for name, role in self._role_defs.items()
+            if role.text_encoding == "bag_of_words"
+        ]
+
+    # -- Words ----------------------------------------------------------------
+
+    def word_vector(self, word: str) -> tuple[str, np.ndarray]:
+        """(lemma, int16 vector) for a BoW word, generated on first use."""
+        entry = self.words.get(word)
+        if entry is None:
+            entry = self.words[word] = self.encode_word(word)
+        return entry
+
+    def query_vector(self, word: str) -> tuple[str, np.ndarray]:
+        """word_vector() for query text: unseen words go to query_words."""
+        entry = self.words.get(word)
+        if entry is None:
+            entry = self.query_words.get(word)
+            if entry is None:
+                entry = self.encode_word(word)
+                self.query_words.put(word, entry)
+        return entry
+
+    def encode_word(self, word: str) -> tuple[str, np.ndarray]:
+        """word_vector() without adding the word to the codebook."""
+        lemma = self._morph.normalize(word)[0] if self._morph is not None else word
+        return lemma, self._chars.encode_word(lemma).astype(np.int16)
+
+    def bag_of_words(self, text: str, grow: bool = True) -> np.ndarray:
+        """int8 bipolar BoW vector, identical to Encoder._encode_bag_of_words().
+
+        grow=False looks words up with query_vector() instead of word_vector().
+        """
+        lookup = self.word_vector if grow else self.query_vector
+        lemmas: dict[str, np.ndarray] = {}
+        for word in bow_words(text):
+            lemma, vec = lookup(word)
+            lemmas.setdefault(lemma, vec)
+        if not lemmas:
+            return self._symbol("__empty__")
+        total = np.sum(list(lemmas.values()), axis=0, dtype=np.int16)
+        return np.where(total >= 0, 1, -1).astype(np.int8)
+
+    # -- Roles ----------------------------------------------------------------
+
+    def _symbol(self, key: str) -> np.ndarray:
+        vec = self._symbols.get(key)
+        if vec is None:
+            vec = self._symbols[key] = self.encoder.generate_symbol(key).data
+        return vec
+
+    def role_vector(self, rname: str, value, grow: bool = True) -> np.ndarray:
+        """Bound role vector (role ⊙ value), as stored in the glyph's role dict."""
+        role = self._role_defs[rname]
+        if role.text_encoding == "bag_of_words":
+            value_vec = self.bag_of_words(str(value), grow)
+        else:
+            value_vec = self._symbol(str(value))
+        return self._symbol(rname) * value_vec
+
+    def encode_roles(self, attributes: dict, role_names) -> dict[str, np.ndarray]:
+        """float32 query role vectors for `role_names`, without building a
+        Glyph or growing the codebook."""
+        return {
+            rname: self.role_vector(rname, attributes[rname], grow=False).astype(np.float32)
+            for rname in role_names
+        }
+
+
+# ---------------------------------------------------------------------------
+# WordEntryTable — per-word contributions to the BoW role scores
+# ---------------------------------------------------------------------------
+
+def bundle_gain(m: int) -> float:
+    """Expected dot(sign(w_1 + … + w_m), w_i) / dim for m random bipolar words.
+
+    The majority bundle keeps only part of each word's signal; this is the
+    factor that turns a sum of per-word contributions into an estimate of the
+    bundled score. Ties (zero sums) resolve to +1, as in Encoder.bundle().
+    """
+    if m <= 0:
+        return 0.0
+    others = m - 1
+    probs  = [math.comb(others, j) / 2 ** others for j in range(others + 1)]
+    sums   = [2 * j - others for j in range(others + 1)]   # sum of the other words
+    plus   = sum(p if 1 + t >= 0 else -p for p, t in zip(probs, sums))
+    minus  = sum(-p if -1 + t >= 0 else p for p, t in zip(probs, sums))
+    return (plus + minus) / 2
+
+
+class WordEntryTable:
+    """Sparse word × entry contribution rows for bag-of-words roles.
+
+    A query BoW role vector is role ⊙ sign(Σ word vectors), and
+    dot(role ⊙ sign(S), entry) is approximated by bundle_gain(m) · Σ dot(role
+    ⊙ w, entry) over the query's m distinct lemmas. Each row keeps only the
+    entries whose |dot| exceeds `sigma` standard deviations of the noise
+    between unrelated bipolar vectors (sqrt(dim)), so a query sums a few short
+    rows instead of taking dense products over the corpus. The estimate is
+    used to pick survivors that are then scored exactly, so the table is
+    approximate: the bundle sign and the sigma cutoff both move entries, and
+    the exact best match can fall outside the survivors.
+
+    Rows exist for the codebook's (corpus) lemmas. A query lemma without one
+    (out of vocabulary) gets its row computed per query into the bounded
+    `query_rows` LRUCache, which set_entry() clears; the table itself only
+    grows with the corpus. Computing that row is a dense product over every
+    entry, so OOV-heavy queries pay close to full-scan cost.
+    """
+
+    def __init__(self, codebook: WordCodebook, matrices: dict[str, np.ndarray],
+                 role_weights: dict[str, float], sigma: float = 4.0,
+                 query_cache_size: int = 1024):
+        self.codebook     = codebook
+        self.matrices     = matrices
+        self.role_weights = {
+            r: w for r, w in role_weights.items() if r in codebook.bow_roles()
+        }
+        self.cutoff = sigma * np.sqrt(codebook.dimension)
+        self.rows: dict[str, dict[str, tuple[np.ndarray, np.ndarray]]] = {
+            rname: {} for rname in self.role_weights
+        }
+        self.query_rows = LRUCache(query_cache_size)
+        self._roles = {
+            rname: codebook._symbol(rname).astype(np.float32) for rname in self.role_weights
+        }
+        # Lemma vectors in row order, grown by doubling. They are stored
+        # unbound: dot(role ⊙ w, e) = dot(w, role ⊙ e), so one matrix serves
+        # every role and set_entry() binds the entry vector instead.
+        self._names: list[str] = []
+        self._known: set[str] = set()
+        self._buffer = np.empty((0, codebook.dimension), dtype=np.float32)
+        lemmas = {lemma: vec for lemma, vec in codebook.words.values()}
+        if lemmas:
+            self._add_rows(lemmas)
+
+    @property
+    def _lemmas(self) -> np.ndarray:
+        """float32 (n_lemmas, dim) vectors of the lemmas that have rows."""
+        return self._buffer[:len(self._names)]
+
+    def _extend_lemmas(self, lemmas: dict[str, np.ndarray]) -> None:
+        n, m = len(self._names), len(lemmas)
+        if len(self._buffer) < n + m:
+            buf = np.empty((max(16, 2 * (n + m)), self.codebook.dimension), dtype=np.float32)
+            buf[:n] = self._lemmas
+            self._buffer = buf
+        self._buffer[n:n + m] = np.stack(list(lemmas.values()))
+        self._names.extend(lemmas)
+        self._known.update(lemmas)
+
+    def _word_rows(self, words: np.ndarray, rname: str,
+                   batch: int = 16384) -> list[tuple[np.ndarray, np.ndarray]]:
+        """(entries, dots) above the cutoff for each word row, against one role.
+
+        Products are taken over `batch` entries at a time, so memory stays at
+        len(words) × batch however large the corpus is.
+        """
+        bound  = words * self._roles[rname]
+        matrix = self.matrices[rname]
+        found: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        for start in range(0, len(matrix), batch):
+            dots = bound @ matrix[start:start + batch].T
+            w, e = np.nonzero(np.abs(dots) > self.cutoff)
+            found.append((w, e + start, dots[w, e]))
+        if not found:
+            empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32))
+            return [empty] * len(words)
+        w, e, v = (np.concatenate(parts) for parts in zip(*found))
+        order   = np.argsort(w, kind="stable")      # entries stay ascending per word
+        w, e, v = w[order], e[order], v[order]
+        bounds  = np.searchsorted(w, np.arange(len(words) + 1))
+        return [(e[lo:hi], v[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def _add_rows(self, lemmas: dict[str, np.ndarray], batch: int = 256) -> None:
+        first = len(self._names)
+        self._extend_lemmas(lemmas)
+        names = list(lemmas)
+        for start in range(0, len(names), batch):
+            chunk = names[start:start + batch]
+            words = self._buffer[first + start:first + start + len(chunk)]
+            for rname in self._roles:
+                self.rows[rname].update(zip(chunk, self._word_rows(words, rname)))
+
+    def set_entry(self, row: int, vectors: dict[str, np.ndarray],
+                  lemmas: dict[str, np.ndarray],
+                  previous: dict[str, np.ndarray] | None = None) -> None:
+        """Recompute one entry's contributions after an index upsert.
+
+        `lemmas` are the entry's lemma vectors; unseen ones get rows over the
+        corpus, which already holds `vectors` at `row`. `previous` are the
+        role vectors `row` held before, when an entry was replaced.
+        """
+        self.query_rows.clear()
+        known = self._lemmas
+        for rname, role in self._roles.items():
+            table = self.rows[rname]
+            query = [vectors[rname] * role]
+            if previous is not None:
+                query.append(previous[rname] * role)
+            dots = known @ np.stack(query, axis=1).astype(np.float32)
+            if previous is not None:
+                for i in np.flatnonzero(np.abs(dots[:, 1]) > self.cutoff):
+                    rows, vals = table[self._names[i]]
+                    hit = rows == row
+                    table[self._names[i]] = (rows[~hit], vals[~hit])
+            for i in np.flatnonzero(np.abs(dots[:, 0]) > self.cutoff):
+                rows, vals = table[self._names[i]]
+                table[self._names[i]] = (np.append(rows, row), np.append(vals, dots[i, 0]))
+        missing = {l: v for l, v in lemmas.items() if l not in self._known}
+        if missing:
+            self._add_rows(missing)
+
+    def lemmas(self, text: str) -> dict[str, np.ndarray]:
+        """Distinct lemmas of a BoW query text → lemma vector, read-only."""
+        found: dict[str, np.ndarray] = {}
+        for word in bow_words(text):
+            lemma, vec = self.codebook.query_vector(word)
+            found.setdefault(lemma, vec)
+        return found
+
+    def row(self, rname: str, lemma: str, vector: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(entries, dots) of one lemma for one role, from the table or query_rows."""
+        row = self.rows[rname].get(lemma)
+        if row is None:
+            row = self.query_rows.get((rname, lemma))
+            if row is None:
+                words = vector.astype(np.float32)[None, :]
+                row = self._word_rows(words, rname)[0]
+                self.query_rows.put((rname, lemma), row)
+        return row
+
+    def estimate(self, attributes: dict, n_entries: int) -> np.ndarray:
+        """Estimated weighted BoW-role contribution (sum of w · cos) per entry."""
+        scores = np.zeros(n_entries, dtype=np.float64)
+        for rname, w in self.role_weights.items():
+            lemmas = self.lemmas(str(attributes.get(rname, "")))
+            if not lemmas:
+                continue
+            gain = bundle_gain(len(lemmas)) * w / self.codebook.dimension
+            for lemma, vector in lemmas.items():
+                rows, vals = self.row(rname, lemma, vector)
+                scores[rows] += vals * gain
+        return scores
@@ -5,6 +5,8 @@ Exports:
   ENCODER_CONFIG — EncoderConfig with semantic + context layers
   encode_query(query) — converts NL question to a Concept for similarity search
   entry_to_record(entry) — converts a JSONL entry to an encodable record
+  entries_to_records(entries) — entry_to_record() over a corpus, with
+                                category inference batched
 
 Primary matching signal: bag-of-words on the question field. Shared words
 between a user question ("how do I install glyphh") and an FAQ entry
@@ -23,7 +25,7 @@ from glyphh.core.config import (
     Segment,
 )
 
-from intent import infer_category, extract_keywords, _preprocess
+from intent import QueryAnalysis, analyze, infer_categories, _preprocess
 
 
 # ---------------------------------------------------------------------------
@@ -100,17 +102,17 @@ ENCODER_CONFIG = EncoderConfig(
 # encode_query — NL question → Concept dict
 # ---------------------------------------------------------------------------
 
-def encode_query(query: str) -> dict:
-    """Convert a raw NL question into a Concept-compatible dict."""
-    cleaned = _preprocess(query)
-    keywords = extract_keywords(cleaned)
+def encode_query(query: str | QueryAnalysis) -> dict:
+    """Convert a raw NL question (or its analyze() result) into a Concept-compatible dict."""
+    analysis = analyze(query)
+    keywords = analysis.keyword_text
 
     # Use keyword-filtered text as the question signal so stopword-only
     # or single-character queries don't produce spurious matches.
-    question_text = keywords if keywords else cleaned
-    category = infer_category(cleaned)
+    question_text = keywords if keywords else analysis.cleaned
+    category = analysis.category
 
-    stable_id = int(hashlib.md5(query.encode()).hexdigest()[:8], 16)
+    stable_id = int(hashlib.md5(analysis.text.encode()).hexdigest()[:8], 16)
 
     return {
         "name": f"query_{stable_id:08d}",
@@ -142,12 +144,14 @@ def entry_to_record(entry: dict) -> dict:
         slug = re.sub(r"[^a-z0-9]+", "_", question.lower()).strip("_")[:40]
         question_id = f"faq_{slug}"
 
-    # Auto-infer category if not provided
+    # Category signals are matched in the raw question (punctuation kept);
+    # they are only scanned when the entry has no category.
+    analysis = analyze(question, raw_signals=True)
     if not category:
-        category = infer_category(question)
+        category = analysis.category
 
     # Preprocess text for consistent BoW encoding
-    question_clean = _preprocess(question)
+    question_clean = analysis.cleaned
     answer_clean = _preprocess(answer)
 
     return {
@@ -166,3 +170,15 @@ def entry_to_record(entry: dict) -> dict:
             "original_question": question,
         },
     }
+
+
+def entries_to_records(entries: list[dict], processes: int = 0) -> list[dict]:
+    """entry_to_record() for every entry, with the category inference for
+    entries that lack one done in a single infer_categories() batch."""
+    missing = [i for i, e in enumerate(entries) if not e.get("category", "")]
+    if missing:
+        questions = [entries[i].get("question", "") for i in missing]
+        entries   = list(entries)
+        for i, category in zip(missing, infer_categories(questions, processes)):
+            entries[i] = {**entries[i], "category": category}
+    return [entry_to_record(e) for e in entries]
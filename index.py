@@ -0,0 +1,1197 @@
+"""
+Vectorized Pattern A scoring index for the FAQ model.
+
+Exports:
+  ROLE_WEIGHTS — Pattern A role weights (question, category, keywords, answer)
+  QUERY_CONSTANT_ROLES — roles encode_query() always leaves empty
+  COARSE_KEY — key of the hierarchical coarse vector in an encoded query
+  glyph_roles(glyph) / glyph_role_values(glyph) — a Glyph's role vectors / raw values
+  glyph_vector(glyph, path) — layer or segment cortex for hierarchical search
+  encode_record(encoder, record) — (glyph, metadata) for an entry_to_record() output
+  entry_digest(attributes, metadata) / digest_entries(digests) — corpus fingerprint parts
+  fuse_roles(roles, weights, dim) — pre-weighted concatenation of role vectors
+  pack_bipolar(vectors) / unpack_bipolar(words, dim) — 1 bit per dimension
+  hamming_distances(packed, q_packed) — popcount distances for packed mode
+  entry_tokens(attributes) / TokenPostings — inverted token index for pruning
+  default_min_candidates(top_k) — candidate count below which pruning falls back
+  select_top_k(scores, k) — O(n) partial selection of the k best scores
+  load_similarity_config() — the `similarity` block of config.yaml
+  FAQIndex — role matrices stacked at load time, scored with one
+             matrix-vector product per role, with optional pruning, routing,
+             bounded, ANN, hierarchical, cached, codebook and word-table
+             stages and in-place upsert/delete
+
+Pattern A scoring is a flat weighted average of per-role cosines. For the
+bipolar vectors produced by the encoder, cosine(q, e) = dot(q, e) / dim, so
+scoring every entry for one role is a single matrix-vector product against
+that role's (n_entries, dim) matrix.
+
+Fused mode goes one step further: each role vector is normalised to unit
+length and scaled by sqrt(w / sum(w)) before concatenation. The dot product
+of two fused vectors is then exactly the Pattern A score, so the whole
+corpus is scored in a single pass and the fused vectors can be stored in a
+single-vector store such as pgvector.
+
+Packed mode stores each bipolar role vector as 1 bit per dimension in uint64
+words. For bipolar vectors cosine(q, e) = 1 - 2 * hamming(q, e) / dim, so a
+popcount of XOR-ed words gives exactly the same score at 1/32 of the float32
+footprint.
+
+With pruning enabled, an inverted index over the question and keywords
+tokens restricts scoring to entries sharing at least one non-stopword token
+with the query, falling back to a full scan when too few candidates remain.
+Entries sharing no token are never scored, so pruning is approximate; the
+default fallback threshold is set high enough to keep the exact best match.
+
+With routing enabled, entries are partitioned by category and a query first
+scores only the partition of its inferred category, expanding to the rest of
+the corpus when the category signal was weak or the best in-partition score
+is below the routing threshold — so open-set queries still see every entry
+before abstaining.
+"""
+
+import hashlib
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import yaml
+
+from glyphh.core.types import Concept, Glyph
+
+from ann import LSHIndex
+from cache import LRUCache, ResultCache, query_key
+from codebook import WordCodebook, WordEntryTable, bow_words
+from encoder import encode_query
+from intent import QueryAnalysis, analyze, extract_keywords, rules_fingerprint
+
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+
+def load_similarity_config(path: Path = CONFIG_PATH) -> dict:
+    """Return the `similarity` block of config.yaml (empty if absent)."""
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return (yaml.safe_load(f) or {}).get("similarity", {}) or {}
+
+
+# Pattern A role weights — must match tests/test_similarity.py
+ROLE_WEIGHTS: dict[str, float] = {
+    "question": 1.0,
+    "category": 0.6,
+    "keywords": 0.8,
+    "answer":   0.4,
+}
+
+
+def glyph_roles(glyph: Glyph) -> dict:
+    """Flatten a glyph's non-internal layers into a role name → Vector dict."""
+    roles: dict = {}
+    for layer in glyph.layers.values():
+        if layer.name.startswith("_"):
+            continue
+        for seg in layer.segments.values():
+            roles.update(seg.roles)
+    return roles
+
+
+def glyph_vector(glyph: Glyph, path: tuple[str, ...]) -> np.ndarray:
+    """Cortex vector at a hierarchy path: (layer,) or (layer, segment)."""
+    layer = glyph.layers[path[0]]
+    if len(path) == 1:
+        return layer.cortex.data
+    return layer.segments[path[1]].cortex.data
+
+
+def entry_digest(attributes: dict, metadata: dict) -> str:
+    """Stable digest of one entry's encoded attributes and metadata."""
+    payload = json.dumps([attributes, metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def digest_entries(digests) -> str:
+    """Corpus digest over entry_digest() values, in row order."""
+    h = hashlib.sha256()
+    for digest in digests:
+        h.update(digest.encode())
+    return h.hexdigest()
+
+
+def encode_record(encoder, record: dict) -> tuple[Glyph, dict]:
+    """(glyph, metadata) for one entry_to_record() output."""
+    concept = Concept(
+        name=record["attributes"]["question_id"],
+        attributes=record["attributes"],
+    )
+    return encoder.encode(concept), record["metadata"]
+
+
+def glyph_role_values(glyph: Glyph) -> dict:
+    """Flatten a glyph's non-internal layers into a role name → raw value dict."""
+    values: dict = {}
+    for layer in glyph.layers.values():
+        if layer.name.startswith("_"):
+            continue
+        for seg in layer.segments.values():
+            values.update(seg.role_values)
+    return values
+
+
+def fuse_roles(roles: dict[str, np.ndarray], role_weights: dict[str, float],
+               dimension: int) -> np.ndarray:
+    """Concatenate role vectors so one dot product yields the Pattern A score.
+
+    Works on a single vector per role (shape (dim,)) or a stack of them
+    (shape (n, dim)); the role axis is always the last one.
+    """
+    total = sum(role_weights.values())
+    parts = [
+        np.asarray(roles[rname], dtype=np.float32)
+        * np.float32(np.sqrt(w / total) / np.sqrt(dimension))
+        for rname, w in role_weights.items()
+    ]
+    return np.ascontiguousarray(np.concatenate(parts, axis=-1))
+
+
+def pack_bipolar(vectors: np.ndarray) -> np.ndarray:
+    """Pack bipolar vectors (+1 → bit 1) into uint64 words along the last axis.
+
+    The last axis is zero-padded up to a multiple of 64 bits. Padding bits are
+    zero on both sides of a comparison, so they never count as disagreements.
+    """
+    bits  = np.asarray(vectors) > 0
+    dim   = bits.shape[-1]
+    pad   = (-dim) % 64
+    if pad:
+        widths = [(0, 0)] * (bits.ndim - 1) + [(0, pad)]
+        bits = np.pad(bits, widths)
+    packed = np.packbits(bits, axis=-1)
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def unpack_bipolar(words: np.ndarray, dimension: int) -> np.ndarray:
+    """Inverse of pack_bipolar(): uint64 words → int8 bipolar vectors."""
+    bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1)
+    bits = bits[..., :dimension].astype(np.int8)
+    return bits * 2 - 1
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:  # NumPy < 2.0
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        counts = _POPCOUNT_TABLE[words.view(np.uint8)]
+        return counts.reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_distances(packed: np.ndarray, q_packed: np.ndarray) -> np.ndarray:
+    """Number of disagreeing dimensions between q and every packed row."""
+    return _popcount(packed ^ q_packed).sum(axis=-1, dtype=np.int64)
+
+
+def select_top_k(scores: np.ndarray, k: int,
+                 rows: np.ndarray | None = None) -> np.ndarray:
+    """Positions of the k best scores, best-first, in O(n + k log k).
+
+    Uses argpartition to find the k-th best score and only sorts the entries
+    at or above it. Ties are ordered by `rows` (corpus row ids, defaulting to
+    positions), so the result equals the head of a stable full sort.
+    """
+    n = len(scores)
+    if rows is None:
+        rows = np.arange(n)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        top = np.flatnonzero(scores >= kth)
+    else:
+        top = np.arange(n)
+    return top[np.lexsort((rows[top], -scores[top]))][:k]
+
+
+# Key of the coarse (layer or segment cortex) vector in an encoded query dict.
+COARSE_KEY = "_coarse"
+
+# encode_query() leaves these attributes empty for every query, so their query
+# role vectors never change and their per-entry cosines can be computed once.
+QUERY_CONSTANT_ROLES = ("answer",)
+
+# Default min_candidates is the larger of these: a pruned candidate set
+# smaller than this falls back to a full scan (see default_min_candidates()).
+MIN_CANDIDATES        = 16
+MIN_CANDIDATES_PER_K  = 4
+
+# Default hierarchical coarse stage: keep the larger of COARSE_TOP_N rows and
+# COARSE_SHARE of the corpus, and rescore in full when the reranked best is
+# within COARSE_MARGIN of route_threshold (see FAQIndex._search_rows()).
+COARSE_TOP_N = 64
+COARSE_SHARE = 0.25
+COARSE_MARGIN = 0.05
+
+# Roles with at most this many distinct vectors in the corpus (category) are
+# scored by a lookup into the distinct vectors instead of a full product.
+LOOKUP_MAX_DISTINCT = 64
+
+
+# ---------------------------------------------------------------------------
+# TokenPostings — inverted index for candidate pruning
+# ---------------------------------------------------------------------------
+
+POSTING_ROLES = ("question", "keywords")
+
+
+def default_min_candidates(top_k: int) -> int:
+    """min_candidates for an index that returns top_k results."""
+    return max(MIN_CANDIDATES, MIN_CANDIDATES_PER_K * top_k)
+
+
+def entry_tokens(attributes: dict) -> set[str]:
+    """Non-stopword tokens of an entry's question and keywords attributes."""
+    tokens: set[str] = set()
+    for rname in POSTING_ROLES:
+        tokens.update(extract_keywords(str(attributes.get(rname, ""))).split())
+    return tokens
+
+
+class TokenPostings:
+    """Token → entry row ids, built from entry_tokens().
+
+    Rows are kept in a set per token, so add() and remove() cost O(1) per
+    token of the entry however long its postings are.
+    """
+
+    def __init__(self):
+        self.postings: dict[str, set[int]] = {}
+        self.row_tokens: dict[int, frozenset[str]] = {}
+
+    def add(self, row: int, tokens: set[str]) -> None:
+        self.row_tokens[row] = frozenset(tokens)
+        for tok in tokens:
+            self.postings.setdefault(tok, set()).add(row)
+
+    def remove(self, row: int) -> None:
+        for tok in self.row_tokens.pop(row, ()):
+            rows = self.postings[tok]
+            rows.discard(row)
+            if not rows:
+                del self.postings[tok]
+
+    def compacted(self, keep: np.ndarray) -> "TokenPostings":
+        """Postings for rows `keep`, renumbered to 0..len(keep)-1."""
+        postings = TokenPostings()
+        for new, old in enumerate(keep):
+            postings.add(new, self.row_tokens.get(int(old), frozenset()))
+        return postings
+
+    def candidates(self, tokens: list[str]) -> np.ndarray:
+        """Sorted unique rows sharing at least one token with the query."""
+        lists = [self.postings[t] for t in set(tokens) if t in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([
+            np.fromiter(rows, dtype=np.int64, count=len(rows)) for rows in lists
+        ]))
+
+
+# ---------------------------------------------------------------------------
+# FAQIndex — stacked role matrices
+# ---------------------------------------------------------------------------
+
+class FAQIndex:
+    """Scores a query against every FAQ entry with one product per role.
+
+    Each role in ROLE_WEIGHTS is stored as a contiguous float32 matrix of
+    shape (n_entries, dim) holding the bipolar role vectors. float32 keeps
+    the products on the BLAS path and represents every integer dot product
+    of 2000-d bipolar vectors exactly. mode="fused" and mode="packed" score
+    the same way from fused or bit-packed vectors (see the module docstring).
+
+    search() returns the top_k best entries (default `similarity.top_k` in
+    config.yaml); search_many() scores a batch with one product per role.
+    Every other option enables one stage, documented where it runs:
+
+      prune, min_candidates, ann, ann_options — candidates()
+      route, route_threshold, route_margin    — partition_rows()
+      bounded                                 — score_bounded()
+      hierarchical, coarse_path, coarse_top_n — coarse_survivors()
+      query_cache_size, codebook              — encode_query()
+      result_cache_size                       — search()
+      word_table, table_top_n                 — table_candidates()
+
+    README.md lists which of them keep results exact. upsert(),
+    upsert_glyph() and delete() edit a built index in place.
+    """
+
+    MODES = ("roles", "fused", "packed")
+
+    # Share of tombstoned rows that triggers compact() after a delete().
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, encoder, role_weights: dict[str, float] | None = None,
+                 mode: str = "roles", prune: bool = False, min_candidates: int | None = None,
+                 route: bool = False, route_threshold: float = 0.40,
+                 route_margin: int = 0, top_k: int | None = None, bounded: bool = False,
+                 ann: bool = False, ann_options: dict | None = None,
+                 hierarchical: bool = False, coarse_path: tuple[str, ...] | None = None,
+                 coarse_top_n: int | None = None, query_cache_size: int = 0,
+                 result_cache_size: int = 0, codebook: bool = False,
+                 word_table: bool = False, table_top_n: int = 64):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown index mode {mode!r}, expected one of {self.MODES}")
+        if bounded and mode == "fused":
+            raise ValueError("bounded=True needs per-role scoring; use mode 'roles' or 'packed'")
+        self.mode         = mode
+        self.encoder      = encoder
+        self.dimension    = encoder.dimension
+        self.role_weights = dict(role_weights or ROLE_WEIGHTS)
+        self.metadata: list[dict] = []
+        self.matrices: dict[str, np.ndarray] = {
+            rname: np.empty((0, self.dimension), dtype=np.float32)
+            for rname in self.role_weights
+        }
+        self.fused: np.ndarray | None = None
+        self.packed: dict[str, np.ndarray] = {}
+        self.prune          = prune
+        self.postings       = TokenPostings()
+        self.route           = route
+        self.route_threshold = route_threshold
+        self.route_margin    = route_margin
+        self.partitions: dict[str, np.ndarray] = {}
+        self.top_k = top_k if top_k is not None else int(
+            load_similarity_config().get("top_k", 1)
+        )
+        self.min_candidates = (
+            min_candidates if min_candidates is not None
+            else default_min_candidates(self.top_k)
+        )
+        self.bounded = bounded
+        self.role_lookup: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.role_constant: dict[str, tuple[bytes, np.ndarray]] = {}
+        self.use_ann     = ann
+        self.ann_options = dict(ann_options or {})
+        self.ann: LSHIndex | None = None
+        self.hierarchical = hierarchical
+        self.coarse_path  = tuple(coarse_path or (
+            load_similarity_config().get("query_scope", "semantic"),
+        ))
+        self.coarse_top_n = coarse_top_n
+        self.coarse: np.ndarray | None = None
+        self.stage_ms: dict[str, float] = {}
+        self.query_cache  = LRUCache(query_cache_size)
+        self.result_cache = ResultCache(result_cache_size)
+        self.entry_digests: list[str] = []
+        self.codebook = WordCodebook(encoder) if codebook or word_table else None
+        self.use_table   = word_table
+        self.table_top_n = table_top_n
+        self.table: WordEntryTable | None = None
+        self._row_of: dict[str, int] | None = {}
+        self._corpus_digest: str | None = None
+        self.tombstones: set[int] = set()
+        self._live: np.ndarray | None = None
+        self._alive: np.ndarray | None = None
+        self._buffers: dict[tuple[str, str], np.ndarray] = {}
+        self._fingerprint: str | None = None
+        self._columns: tuple[tuple[int, str], dict[str, np.ndarray]] | None = None
+
+    @classmethod
+    def from_glyphs(cls, encoder, glyphs: list[tuple[Glyph, dict]],
+                    role_weights: dict[str, float] | None = None,
+                    mode: str = "roles", **options) -> "FAQIndex":
+        """Build an index from encoded (glyph, metadata) pairs."""
+        index = cls(encoder, role_weights, mode, **options)
+        rows: dict[str, list[np.ndarray]] = {r: [] for r in index.role_weights}
+        coarse: list[np.ndarray] = []
+        for row, (glyph, meta) in enumerate(glyphs):
+            roles = glyph_roles(glyph)
+            for rname in index.role_weights:
+                rows[rname].append(roles[rname].data)
+            if index.hierarchical:
+                coarse.append(glyph_vector(glyph, index.coarse_path))
+            values = glyph_role_values(glyph)
+            index.metadata.append(meta)
+            index.row_of[meta.get("question_id", glyph.name)] = row
+            index.entry_digests.append(entry_digest(values, meta))
+            index.postings.add(row, entry_tokens(values))
+            if index.codebook is not None:
+                for rname in index.codebook.bow_roles():
+                    for word in bow_words(values.get(rname, "")):
+                        index.codebook.word_vector(word)
+        for rname, vecs in rows.items():
+            if vecs:
+                index.matrices[rname] = np.ascontiguousarray(
+                    np.stack(vecs), dtype=np.float32,
+                )
+        if index.hierarchical:
+            index.coarse = (
+                np.ascontiguousarray(np.stack(coarse), dtype=np.float32) if coarse
+                else np.empty((0, index.dimension), dtype=np.float32)
+            )
+        index._build_derived()
+        return index
+
+    @classmethod
+    def from_records(cls, encoder, records: list[dict],
+                     role_weights: dict[str, float] | None = None,
+                     mode: str = "roles", **options) -> "FAQIndex":
+        """Encode entry_to_record() outputs and build an index from them."""
+        glyphs = [encode_record(encoder, record) for record in records]
+        return cls.from_glyphs(encoder, glyphs, role_weights, mode, **options)
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    def _options_signature(self) -> dict:
+        """Index options that change which results a query returns."""
+        return {
+            "role_weights":    self.role_weights,
+            "prune":           self.prune,
+            "min_candidates":  self.min_candidates,
+            "route":           self.route,
+            "route_threshold": self.route_threshold,
+            "route_margin":    self.route_margin,
+            "ann":             self.use_ann,
+            "ann_options":     self.ann_options,
+            "hierarchical":    self.hierarchical,
+            "coarse_path":     self.coarse_path,
+            "coarse_top_n":    self.coarse_top_n,
+            "word_table":      self.use_table,
+            "table_top_n":     self.table_top_n,
+        }
+
+    @property
+    def row_of(self) -> dict[str, int]:
+        """question_id → row of every live entry."""
+        if self._row_of is None:
+            self._row_of = {
+                self.metadata[r]["question_id"]: int(r) for r in self.live_rows()
+            }
+        return self._row_of
+
+    @row_of.setter
+    def row_of(self, value: dict[str, int]) -> None:
+        self._row_of = value
+
+    def corpus_digest(self) -> str:
+        """Digest of every entry's attributes and metadata, in row order."""
+        if self._corpus_digest is None:
+            self._corpus_digest = digest_entries(self.entry_digests)
+        return self._corpus_digest
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest of the encoder config, rules, index options and corpus."""
+        if self._fingerprint is None:
+            self._fingerprint = self._compute_fingerprint()
+            self.result_cache.bind(self._fingerprint)
+        return self._fingerprint
+
+    def _compute_fingerprint(self) -> str:
+        h = hashlib.sha256()
+        h.update(self.encoder.config.to_json().encode())
+        h.update(rules_fingerprint().encode())
+        h.update(json.dumps(self._options_signature(), sort_keys=True, default=str).encode())
+        h.update(self.corpus_digest().encode())
+        return h.hexdigest()
+
+    def _build_derived(self) -> None:
+        """Rebuild the mode-specific structures from the role matrices."""
+        self._refresh()
+        if self.mode == "fused" and self.fused is None:
+            self.fused = fuse_roles(self.matrices, self.role_weights, self.dimension)
+        elif self.mode == "packed" and self.matrices:
+            self.packed = {
+                rname: pack_bipolar(matrix) for rname, matrix in self.matrices.items()
+            }
+            self.matrices = {}
+
+        self.ann = None
+        if self.use_ann and len(self):
+            self.ann = self._build_ann()
+
+        self.role_lookup = {}
+        self.role_constant = {}
+        self.table = None
+        if not (self.bounded or self.use_table):
+            return
+        # An empty index has no distinct vectors to look up yet.
+        for rname in self.role_weights if len(self) else ():
+            uniques, inverse = np.unique(
+                self.role_matrix(rname), axis=0, return_inverse=True,
+            )
+            if len(uniques) <= LOOKUP_MAX_DISTINCT:
+                self.role_lookup[rname] = (uniques, inverse.reshape(-1))
+        probe = self.encode_query("")
+        for rname in QUERY_CONSTANT_ROLES:
+            if rname in self.role_weights and rname not in self.role_lookup:
+                q = probe[rname]
+                self.role_constant[rname] = (q.tobytes(), self._role_cos(rname, q))
+
+        if self.use_table:
+            # Shares the role matrices, or keeps unpacked copies in packed mode.
+            matrices = self.matrices if self.matrices else {
+                r: self.role_matrix(r)
+                for r in self.codebook.bow_roles() if r in self.role_weights
+            }
+            self.table = WordEntryTable(self.codebook, matrices, self.role_weights)
+
+    def _build_ann(self) -> LSHIndex:
+        """LSHIndex over the fused vectors of every row."""
+        fused = self.fused if self.fused is not None else fuse_roles(
+            {r: self.role_matrix(r) for r in self.role_weights},
+            self.role_weights, self.dimension,
+        )
+        return LSHIndex(fused, **self.ann_options)
+
+    def _refresh(self) -> None:
+        """Re-derive the live rows and partitions from scratch."""
+        self._live = None
+        self._alive = None
+        self._fingerprint = None
+        live = self.live_rows()
+        categories = getattr(self.metadata, "categories", None)
+        if categories is None:
+            categories = np.array(
+                [m.get("category", "") for m in self.metadata], dtype=object,
+            )
+        categories = categories[live]
+        self.partitions = {
+            cat: live[categories == cat] for cat in dict.fromkeys(categories)
+        }
+
+    def _partition_add(self, category: str, row: int) -> None:
+        part = self.partitions.get(category)
+        if part is None:
+            self.partitions[category] = np.array([row], dtype=np.intp)
+        elif row > part[-1]:
+            self.partitions[category] = self._append_row(("partition", category), part, row)
+        else:
+            self.partitions[category] = np.insert(part, np.searchsorted(part, row), row)
+
+    def _partition_remove(self, category: str, row: int) -> None:
+        part = self.partitions[category]
+        part = np.delete(part, np.searchsorted(part, row))
+        if len(part):
+            self.partitions[category] = part
+        else:
+            del self.partitions[category]
+
+    def live_mask(self) -> np.ndarray:
+        """Boolean mask over rows, False for tombstones."""
+        if self._alive is None:
+            self._alive = np.ones(len(self), dtype=bool)
+            self._alive[list(self.tombstones)] = False
+        return self._alive
+
+    def live_rows(self) -> np.ndarray:
+        """Sorted row ids that are not tombstoned, rebuilt on first use after a delete."""
+        if self._live is None:
+            self._live = np.flatnonzero(self.live_mask())
+        return self._live
+
+    def role_matrix(self, rname: str) -> np.ndarray:
+        """Float32 (n_entries, dim) matrix for one role, in any mode.
+
+        Packed mode releases the float32 matrices after the build, so the
+        role is unpacked on demand.
+        """
+        if rname in self.matrices:
+            return self.matrices[rname]
+        return unpack_bipolar(self.packed[rname], self.dimension).astype(np.float32)
+
+    def role_columns(self, rname: str) -> np.ndarray:
+        """Read-only transposed (dim, n_entries) role matrix, shared by every
+        TypeaheadSession and rebuilt on first use after an edit."""
+        state = (len(self), self.fingerprint)
+        if self._columns is None or self._columns[0] != state:
+            self._columns = (state, {})
+        columns = self._columns[1].get(rname)
+        if columns is None:
+            columns = np.ascontiguousarray(self.role_matrix(rname).T)
+            columns.setflags(write=False)
+            self._columns[1][rname] = columns
+        return columns
+
+    def nbytes(self) -> int:
+        """Bytes held by the scoring structures (role, fused and packed arrays)."""
+        arrays = list(self.matrices.values()) + list(self.packed.values())
+        for extra in (self.fused, self.coarse):
+            if extra is not None:
+                arrays.append(extra)
+        return sum(a.nbytes for a in arrays)
+
+    # -- Mutation -----------------------------------------------------------
+
+    def _row_arrays(self) -> dict[tuple[str, str], np.ndarray]:
+        """Every (n_entries, ...) array indexed by row, keyed for _store_rows()."""
+        arrays = {("matrices", r): m for r, m in self.matrices.items()}
+        arrays.update({("packed", r): p for r, p in self.packed.items()})
+        if self.fused is not None:
+            arrays[("fused", "")] = self.fused
+        if self.coarse is not None:
+            arrays[("coarse", "")] = self.coarse
+        if self.table is not None and self.table.matrices is not self.matrices:
+            arrays.update({("table", r): m for r, m in self.table.matrices.items()})
+        return arrays
+
+    def _store_rows(self, key: tuple[str, str], array: np.ndarray) -> None:
+        kind, name = key
+        if kind == "matrices":
+            self.matrices[name] = array
+        elif kind == "packed":
+            self.packed[name] = array
+        elif kind == "fused":
+            self.fused = array
+        elif kind == "coarse":
+            self.coarse = array
+        else:
+            self.table.matrices[name] = array
+
+    def _append_row(self, key: tuple[str, str], array: np.ndarray,
+                    vector: np.ndarray) -> np.ndarray:
+        """array + one row, as a view into a buffer that grows by doubling."""
+        n   = len(array)
+        buf = self._buffers.get(key)
+        if buf is None or array.base is not buf or len(buf) <= n:
+            buf = np.empty((max(16, 2 * n),) + array.shape[1:], dtype=array.dtype)
+            buf[:n] = array
+            self._buffers[key] = buf
+        buf[n] = vector
+        return buf[:n + 1]
+
+    def upsert(self, record: dict) -> int:
+        """Encode an entry_to_record() output and add or replace its entry."""
+        return self.upsert_glyph(*encode_record(self.encoder, record))
+
+    def upsert_glyph(self, glyph: Glyph, metadata: dict) -> int:
+        """Add or replace the entry with metadata["question_id"]; returns its row.
+
+        Every structure is updated in place; row arrays grow by doubling into
+        spare capacity.
+        """
+        qid    = metadata.get("question_id", glyph.name)
+        row    = self.row_of.get(qid, len(self))
+        append = row == len(self)
+        roles  = glyph_roles(glyph)
+        vecs   = {r: roles[r].data.astype(np.float32) for r in self.role_weights}
+        values = glyph_role_values(glyph)
+
+        rows = {("matrices", r): vecs[r] for r in self.matrices}
+        rows.update({("packed", r): pack_bipolar(vecs[r][None, :])[0] for r in self.packed})
+        rows[("fused", "")]  = fuse_roles(vecs, self.role_weights, self.dimension)
+        rows[("coarse", "")] = (
+            glyph_vector(glyph, self.coarse_path) if self.coarse is not None else None
+        )
+        rows.update({("table", r): vecs[r] for r in self.role_weights})
+        replaced = None
+        if self.table is not None and not append:
+            replaced = {r: self.table.matrices[r][row].copy() for r in self.table.role_weights}
+        for key, array in self._row_arrays().items():
+            if append:
+                self._store_rows(key, self._append_row(key, array, rows[key]))
+            else:
+                if not array.flags.writeable:     # e.g. mapped from an index file
+                    array = array.copy()
+                    self._store_rows(key, array)
+                array[row] = rows[key]
+
+        digest = entry_digest(values, metadata)
+        self._corpus_digest = None
+        self._fingerprint = None
+        category = metadata.get("category", "")
+        if append:
+            self.metadata.append(metadata)
+            self.entry_digests.append(digest)
+            if self._live is not None:
+                self._live = self._append_row(("live", ""), self._live, row)
+            if self._alive is not None:
+                self._alive = self._append_row(("alive", ""), self._alive, True)
+            self._partition_add(category, row)
+        else:
+            previous = self.metadata[row].get("category", "")
+            if previous != category:
+                self._partition_remove(previous, row)
+                self._partition_add(category, row)
+            self.metadata[row] = metadata
+            self.entry_digests[row] = digest
+            self.postings.remove(row)
+        self.row_of[qid] = row
+        self.postings.add(row, entry_tokens(values))
+        lemmas: dict[str, np.ndarray] = {}
+        if self.codebook is not None:
+            for rname in self.codebook.bow_roles():
+                for word in bow_words(values.get(rname, "")):
+                    lemma, vec = self.codebook.word_vector(word)
+                    lemmas.setdefault(lemma, vec)
+
+        for rname in list(self.role_lookup):
+            self._lookup_row(rname, row, vecs[rname])
+        for rname, (q_bytes, cos) in self.role_constant.items():
+            q   = np.frombuffer(q_bytes, dtype=np.float32)
+            value = float(vecs[rname] @ q) / self.dimension
+            if append:
+                cos = self._append_row(("constant", rname), cos, value)
+            else:
+                cos[row] = value
+            self.role_constant[rname] = (q_bytes, cos)
+        if self.ann is not None:
+            self.ann.add(row, rows[("fused", "")])
+        elif self.use_ann:      # built empty: hash the corpus once it has rows
+            self.ann = self._build_ann()
+        if self.table is not None:
+            self.table.set_entry(row, vecs, lemmas, replaced)
+        return row
+
+    def _lookup_row(self, rname: str, row: int, vector: np.ndarray) -> None:
+        """Point `row` of a lookup role at its (possibly new) distinct vector."""
+        uniques, inverse = self.role_lookup[rname]
+        match = np.flatnonzero((uniques == vector).all(axis=1))
+        if len(match):
+            slot = match[0]
+        elif len(uniques) < LOOKUP_MAX_DISTINCT:
+            uniques = np.vstack([uniques, vector.astype(uniques.dtype)])
+            slot = len(uniques) - 1
+        else:
+            del self.role_lookup[rname]
+            return
+        if row == len(inverse):
+            inverse = self._append_row(("lookup", rname), inverse, slot)
+        else:
+            inverse[row] = slot
+        self.role_lookup[rname] = (uniques, inverse)
+
+    def delete(self, question_id: str) -> bool:
+        """Tombstone the entry with `question_id`; False if there is none.
+
+        A delete only touches the entry's postings and its live-mask bit. The
+        row stays in its partition until compact(), which runs once
+        tombstones exceed COMPACT_RATIO of the rows; candidates() and
+        partitions_of() skip it meanwhile.
+        """
+        row = self.row_of.pop(question_id, None)
+        if row is None:
+            return False
+        self.tombstones.add(row)
+        self._corpus_digest = None
+        self._fingerprint = None
+        self.entry_digests[row] = ""
+        self.postings.remove(row)
+        self._live = None
+        if self._alive is not None:
+            self._alive[row] = False
+        if len(self.tombstones) > self.COMPACT_RATIO * len(self):
+            self.compact()
+        return True
+
+    def compact(self) -> None:
+        """Drop tombstoned rows, renumbering the rest, and rebuild derived state."""
+        if not self.tombstones:
+            return
+        keep = self.live_rows()
+        renumber = np.full(len(self), -1, dtype=np.int64)
+        renumber[keep] = np.arange(len(keep))
+        # The word table (and its private matrices) is rebuilt below.
+        for key, array in self._row_arrays().items():
+            if key[0] != "table":
+                self._store_rows(key, np.ascontiguousarray(array[keep]))
+        self._buffers = {}
+        self.metadata      = [self.metadata[r] for r in keep]
+        self.entry_digests = [self.entry_digests[r] for r in keep]
+        self.postings = self.postings.compacted(keep)
+        self.row_of   = {qid: int(renumber[r]) for qid, r in self.row_of.items()}
+        self.tombstones = set()
+        self._corpus_digest = None
+        self._build_derived()
+
+    # -- Query side ---------------------------------------------------------
+
+    def encode_query(self, query: str | QueryAnalysis) -> dict[str, np.ndarray]:
+        """Encode a raw NL question (or its analyze() result) into role name → float32 vector.
+
+        query_cache_size > 0 keeps an LRUCache of read-only encodings keyed by
+        cache.query_key(), so repeats and word-order/stopword paraphrases skip
+        encoding. codebook=True assembles the role vectors from WordCodebook
+        word vectors instead of Encoder.encode(), except on a hierarchical
+        index, which needs the full glyph's cortices.
+        """
+        if self.query_cache.maxsize <= 0:
+            return self._encode_query(query)
+        key = query_key(query)
+        encoded = self.query_cache.get(key)
+        if encoded is None:
+            encoded = self._encode_query(query)
+            for vec in encoded.values():
+                vec.setflags(write=False)
+            self.query_cache.put(key, encoded)
+        return encoded
+
+    def _encode_query(self, query: str | QueryAnalysis) -> dict[str, np.ndarray]:
+        record = encode_query(query)
+        if self.codebook is not None and not self.hierarchical:
+            return self.codebook.encode_roles(record["attributes"], self.role_weights)
+        q_concept = Concept(name=record["name"], attributes=record["attributes"])
+        q_glyph   = self.encoder.encode(q_concept)
+        q_roles   = glyph_roles(q_glyph)
+        encoded   = {
+            rname: q_roles[rname].data.astype(np.float32)
+            for rname in self.role_weights
+        }
+        if self.hierarchical:
+            encoded[COARSE_KEY] = glyph_vector(q_glyph, self.coarse_path).astype(np.float32)
+        return encoded
+
+    def encode_queries(self, queries: list[str | QueryAnalysis]) -> dict[str, np.ndarray]:
+        """Encode a batch of questions into role name → (n_queries, dim) matrix."""
+        encoded = [self.encode_query(q) for q in queries]
+        keys = list(self.role_weights) + ([COARSE_KEY] if self.hierarchical else [])
+        return {
+            key: np.ascontiguousarray(
+                np.stack([e[key] for e in encoded])
+                if encoded else np.empty((0, self.dimension), dtype=np.float32)
+            )
+            for key in keys
+        }
+
+    def score_many(self, q_matrices: dict[str, np.ndarray]) -> np.ndarray:
+        """Pattern A scores for a batch of queries, shape (n_queries, n_entries)."""
+        n_queries = len(next(iter(q_matrices.values())))
+        if self.mode == "fused":
+            q_fused = fuse_roles(q_matrices, self.role_weights, self.dimension)
+            return (q_fused @ self.fused.T).astype(np.float64)
+
+        weighted = np.zeros((n_queries, len(self)), dtype=np.float64)
+        for rname, w in self.role_weights.items():
+            if self.mode == "packed":
+                q_packed = pack_bipolar(q_matrices[rname])
+                dist = np.zeros((n_queries, len(self)), dtype=np.int64)
+                for qi, q in enumerate(q_packed):
+                    dist[qi] = hamming_distances(self.packed[rname], q)
+                weighted += (1.0 - 2.0 * dist / self.dimension) * w
+            else:
+                dots = q_matrices[rname] @ self.matrices[rname].T
+                weighted += dots.astype(np.float64) * (w / self.dimension)
+        return weighted / sum(self.role_weights.values())
+
+    def _role_cos(self, rname: str, q: np.ndarray,
+                  rows: np.ndarray | None = None) -> np.ndarray:
+        """Cosine of one query role vector against every entry (or `rows`)."""
+        if rname in self.role_lookup:
+            uniques, inverse = self.role_lookup[rname]
+            cos = (uniques @ q).astype(np.float64) / self.dimension
+            return cos[inverse if rows is None else inverse[rows]]
+        if rname in self.role_constant and self.role_constant[rname][0] == q.tobytes():
+            cos = self.role_constant[rname][1]
+            return cos if rows is None else cos[rows]
+        if self.mode == "packed":
+            packed = self.packed[rname] if rows is None else self.packed[rname][rows]
+            return 1.0 - 2.0 * hamming_distances(packed, pack_bipolar(q)) / self.dimension
+        matrix = self.matrices[rname] if rows is None else self.matrices[rname][rows]
+        return (matrix @ q).astype(np.float64) / self.dimension
+
+    def score(self, q_roles: dict[str, np.ndarray],
+              rows: np.ndarray | None = None) -> np.ndarray:
+        """Pattern A weighted score of every entry (or only `rows`)."""
+        if self.mode == "fused":
+            q_fused = fuse_roles(q_roles, self.role_weights, self.dimension)
+            fused = self.fused if rows is None else self.fused[rows]
+            return (fused @ q_fused).astype(np.float64)
+
+        n = len(self) if rows is None else len(rows)
+        weighted = np.zeros(n, dtype=np.float64)
+        for rname, w in self.role_weights.items():
+            weighted += self._role_cos(rname, q_roles[rname], rows) * w
+        return weighted / sum(self.role_weights.values())
+
+    def score_bounded(self, q_roles: dict[str, np.ndarray], k: int,
+                      rows: np.ndarray | None = None) -> np.ndarray:
+        """score() with bound-based early termination; pruned entries get -inf.
+
+        bounded=True (roles and packed modes) evaluates the cheap roles first
+        — low-cardinality roles by lookup, query-constant roles from a cache
+        — then the rest in descending weight order, dropping every entry
+        whose best possible final score cannot reach the current k-th best.
+        The top-k equals a full scoring pass. Fused mode has a single product,
+        so bounded=True raises ValueError there; search_many() ignores it
+        except on a hierarchical index.
+        """
+        rows  = np.arange(len(self)) if rows is None else rows
+        if k <= 0:
+            return np.full(len(rows), -np.inf)
+        total = sum(self.role_weights.values())
+        cheap = [
+            r for r in self.role_weights
+            if r in self.role_lookup or (
+                r in self.role_constant
+                and self.role_constant[r][0] == q_roles[r].tobytes()
+            )
+        ]
+        pending = sorted(
+            (r for r in self.role_weights if r not in cheap),
+            key=lambda r: -self.role_weights[r],
+        )
+
+        partial = np.zeros(len(rows), dtype=np.float64)
+        for rname in cheap:
+            partial += self._role_cos(rname, q_roles[rname], rows) * self.role_weights[rname]
+
+        alive     = np.arange(len(rows))
+        remaining = sum(self.role_weights[r] for r in pending)
+        for step, rname in enumerate(pending):
+            w = self.role_weights[rname]
+            remaining -= w
+            partial[alive] += self._role_cos(rname, q_roles[rname], rows[alive]) * w
+            if remaining <= 0 or len(alive) <= k:
+                continue
+            # Settle the k most promising entries exactly to get the current
+            # k-th best, then drop everything whose upper bound falls short.
+            lead  = alive[select_top_k(partial[alive], k, rows[alive])]
+            exact = partial[lead].copy()
+            for later in pending[step + 1:]:
+                exact += self._role_cos(later, q_roles[later], rows[lead]) * self.role_weights[later]
+            alive = alive[partial[alive] + remaining >= exact.min()]
+
+        scores = np.full(len(rows), -np.inf)
+        scores[alive] = partial[alive] / total
+        return scores
+
+    def _score_rows(self, q_roles: dict[str, np.ndarray], rows: np.ndarray | None,
+                    k: int) -> np.ndarray:
+        """score() or score_bounded(), depending on the index options."""
+        if self.bounded:
+            return self.score_bounded(q_roles, k, rows)
+        return self.score(q_roles, rows)
+
+    def coarse_limit(self) -> int:
+        """Survivors kept by the coarse stage: coarse_top_n, or by default
+        the larger of COARSE_TOP_N and COARSE_SHARE of the corpus."""
+        if self.coarse_top_n is not None:
+            return self.coarse_top_n
+        return max(COARSE_TOP_N, math.ceil(COARSE_SHARE * len(self)))
+
+    def coarse_survivors(self, q_roles: dict[str, np.ndarray],
+                         rows: np.ndarray | None = None) -> np.ndarray:
+        """The coarse_limit() rows (sorted) with the best coarse cosine.
+
+        hierarchical=True stores one cortex vector per entry at coarse_path —
+        (layer,) or (layer, segment), by default the `similarity.query_scope`
+        layer — and reranks only these survivors with full scoring. The
+        coarse vector is a weak proxy for the Pattern A score, so confident
+        matches can differ from a full scan; near-threshold ones are rescored
+        in full (see _search_rows()). stage_ms holds the last query's coarse
+        and fine timings.
+        """
+        scope  = np.arange(len(self)) if rows is None else rows
+        coarse = self.coarse if rows is None else self.coarse[rows]
+        cos    = (coarse @ q_roles[COARSE_KEY]).astype(np.float64)
+        return np.sort(scope[select_top_k(cos, self.coarse_limit(), scope)])
+
+    def _search_rows(self, q_roles: dict[str, np.ndarray], rows: np.ndarray | None,
+                     k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(scores, rows) for `rows` (None = all), coarse-filtered if hierarchical.
+
+        A coarse-filtered best score below route_threshold + COARSE_MARGIN is
+        too close to abstaining to trust, so `rows` are then scored in full.
+        """
+        scope = np.arange(len(self)) if rows is None else rows
+        if self.hierarchical and self.coarse is not None:
+            start = time.perf_counter()
+            kept  = self.coarse_survivors(q_roles, rows)
+            mid   = time.perf_counter()
+            scores = self._score_rows(q_roles, kept, k)
+            if len(kept) < len(scope) and (
+                    not len(scores) or scores.max() < self.route_threshold + COARSE_MARGIN):
+                scores, kept = self._score_rows(q_roles, rows, k), scope
+            self.stage_ms["coarse"] += (mid - start) * 1000
+            self.stage_ms["fine"]   += (time.perf_counter() - mid) * 1000
+            return scores, kept
+        return self._score_rows(q_roles, rows, k), scope
+
+    def candidates(self, query: str | QueryAnalysis,
+                   q_roles: dict[str, np.ndarray] | None = None,
+                   fallback: bool | None = None) -> np.ndarray | None:
+        """Rows to score for `query`, or None for a full scan.
+
+        prune=True keeps the TokenPostings rows sharing a keyword with the
+        query. That is lossy: an entry sharing no token (an abbreviation,
+        another inflection) is never scored, so fewer than min_candidates
+        rows (default_min_candidates(top_k)) fall back to a full scan.
+        ann=True keeps (or intersects with) the LSHIndex candidates of the
+        fused query; ann_options go to LSHIndex and ann.tune_probes() picks
+        the probe count for a recall target. word_table=True then narrows
+        the rows with table_candidates().
+
+        Never None once the index holds tombstones: a full scan is then the
+        live rows. fallback=None applies min_candidates; True skips pruning
+        and ANN as if too few rows survived them, False never falls back
+        (ShardedIndex applies min_candidates across all shards).
+        """
+        query = analyze(query)
+        rows  = None
+        if self.prune and fallback is not True:
+            rows = self.postings.candidates(list(query.keywords))
+        if self.ann is not None and fallback is not True:
+            if q_roles is None:
+                q_roles = self.encode_query(query)
+            near = self.ann.candidates(fuse_roles(q_roles, self.role_weights, self.dimension))
+            rows = near if rows is None else np.intersect1d(rows, near)
+        if self.tombstones and rows is not None:
+            rows = np.intersect1d(rows, self.live_rows())
+        if fallback is None and rows is not None and len(rows) < max(self.min_candidates, 1):
+            rows = None
+        if self.tombstones and rows is None:
+            rows = self.live_rows()
+        if self.table is not None:
+            if q_roles is None:
+                q_roles = self.encode_query(query)
+            rows = self.table_candidates(query, q_roles, rows)
+        return rows
+
+    def table_candidates(self, query: str | QueryAnalysis, q_roles: dict[str, np.ndarray],
+                         rows: np.ndarray | None = None) -> np.ndarray:
+        """The table_top_n rows (sorted) with the best word-table estimate.
+
+        word_table=True (implies codebook=True) estimates the question and
+        keywords roles from WordEntryTable's per-word sums and adds the exact
+        cosines of the lookup and query-constant roles. Only the survivors
+        are scored exactly, so a small table_top_n can drop the best match,
+        and query words outside the corpus vocabulary cost a dense product.
+        """
+        query    = analyze(query)
+        keywords = query.keyword_text
+        attributes = {"question": keywords or query.cleaned, "keywords": keywords}
+        estimate = self.table.estimate(attributes, len(self))
+        for rname, w in self.role_weights.items():
+            if rname in self.table.role_weights:
+                continue
+            if rname in self.role_lookup or (
+                rname in self.role_constant
+                and self.role_constant[rname][0] == q_roles[rname].tobytes()
+            ):
+                estimate += self._role_cos(rname, q_roles[rname]) * w
+        scope = np.arange(len(self)) if rows is None else rows
+        return np.sort(scope[select_top_k(estimate[scope], self.table_top_n, scope)])
+
+    def partition_rows(self, query: str | QueryAnalysis) -> np.ndarray | None:
+        """Rows of the query's inferred category, or None if routing doesn't apply.
+
+        route=True scores this partition first and only expands to the
+        remaining entries when the query carries no category signal or the
+        best in-partition score is below route_threshold. With
+        route_margin > 0 a query whose best category leads the runner-up by
+        fewer signal hits uses the top two partitions, or none when the
+        runner-up doesn't lead the third either (intent.route_categories()).
+        """
+        if not self.route:
+            return None
+        return self.category_rows(query)
+
+    def category_rows(self, query: str | QueryAnalysis) -> np.ndarray | None:
+        """Rows of the partitions route_categories() picks for the query, or
+        None for a full scan. Ignores self.route."""
+        return self.partitions_of(analyze(query).route_categories(self.route_margin))
+
+    def partitions_of(self, categories: tuple[str, ...]) -> np.ndarray | None:
+        """Sorted live rows of the given categories' partitions, or None if none exist."""
+        parts = [self.partitions[c] for c in categories if c in self.partitions]
+        if self.tombstones:
+            alive = self.live_mask()
+            parts = [p[alive[p]] for p in parts]
+            parts = [p for p in parts if len(p)]
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else np.union1d(*parts)
+
+    def _ranked(self, scores: np.ndarray, rows: np.ndarray,
+                top_k: int) -> list[tuple[float, dict[str, Any]]]:
+        """The top_k (score, metadata) pairs best-first; ties keep corpus order."""
+        return [
+            (float(scores[i]), self.metadata[rows[i]])
+            for i in select_top_k(scores, top_k, rows)
+        ]
+
+    def search(self, query: str | QueryAnalysis,
+               top_k: int | None = None) -> list[tuple[float, dict[str, Any]]]:
+        """Score a raw question and return the top_k (score, metadata) best-first.
+
+        result_cache_size > 0 caches results per canonical query and k, bound
+        to `fingerprint` (encoder config, rules, options and every entry), so
+        any edit or config change drops them. stage_ms is zero on a hit.
+        """
+        k = self.top_k if top_k is None else top_k
+        query = analyze(query)
+        if self.result_cache.maxsize <= 0:
+            return self._search(query, k)
+        self.result_cache.bind(self.fingerprint)    # drops results after an edit
+        routed = query.route_categories(self.route_margin) if self.route else ()
+        # recall_report() and tune_probes() switch ANN off or re-probe at runtime.
+        probes = self.ann.n_probes if self.ann is not None else None
+        key = (query_key(query), query.has_signal, routed, probes, k)
+        results = self.result_cache.get(key)
+        if results is None:
+            results = self._search(query, k)
+            self.result_cache.put(key, results)
+        else:
+            self.stage_ms = {"coarse": 0.0, "fine": 0.0}
+        return list(results)
+
+    def _search(self, query: QueryAnalysis, k: int) -> list[tuple[float, dict[str, Any]]]:
+        self.stage_ms = {"coarse": 0.0, "fine": 0.0}
+        return self._search_encoded(query, self.encode_query(query), k)
+
+    def _search_encoded(self, query: QueryAnalysis, q_roles: dict[str, np.ndarray],
+                        k: int) -> list[tuple[float, dict[str, Any]]]:
+        """search() for an already-encoded query; adds to stage_ms."""
+        rows = self.candidates(query, q_roles)
+        part = self.partition_rows(query)
+        if part is not None:
+            first = part if rows is None else np.intersect1d(part, rows)
+            if len(first):
+                scores, kept = self._search_rows(q_roles, first, k)
+                if scores.max() >= self.route_threshold:
+                    return self._ranked(scores, kept, k)
+                scope = np.arange(len(self)) if rows is None else rows
+                rest_scores, rest = self._search_rows(q_roles, np.setdiff1d(scope, first), k)
+                return self._ranked(
+                    np.concatenate([scores, rest_scores]),
+                    np.concatenate([kept, rest]),
+                    k,
+                )
+
+        scores, scope = self._search_rows(q_roles, rows, k)
+        return self._ranked(scores, scope, k)
+
+    def search_many(self, queries: list[str | QueryAnalysis],
+                    top_k: int | None = None) -> list[list[tuple[float, dict[str, Any]]]]:
+        """Batch search(): one top_k list per query, scored in one pass per role.
+
+        A hierarchical index instead reranks each query's coarse survivors,
+        as search() does; stage_ms then totals the whole batch.
+        """
+        k      = self.top_k if top_k is None else top_k
+        queries = [analyze(q) for q in queries]
+        encoded = self.encode_queries(queries)
+        if self.hierarchical and self.coarse is not None:
+            self.stage_ms = {"coarse": 0.0, "fine": 0.0}
+            return [
+                self._search_encoded(query, {r: m[qi] for r, m in encoded.items()}, k)
+                for qi, query in enumerate(queries)
+            ]
+        scores  = self.score_many(encoded)
+        results = []
+        for qi, (query, row_scores) in enumerate(zip(queries, scores)):
+            rows  = self.candidates(query, {r: m[qi] for r, m in encoded.items()})
+            scope = np.arange(len(self)) if rows is None else rows
+            part  = self.partition_rows(query)
+            if part is not None:
+                first = np.intersect1d(part, scope)
+                if len(first) and row_scores[first].max() >= self.route_threshold:
+                    scope = first
+            results.append(self._ranked(row_scores[scope], scope, k))
+        return results
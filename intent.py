@@ -3,12 +3,27 @@ FAQ intent extraction for Glyphh AI knowledge base.
 
 Extracts category and keywords from natural language questions.
 No SDK dependencies — purely local keyword matching.
+
+analyze(text) tokenizes once and returns a QueryAnalysis carrying the cleaned
+text, tokens, keywords and (computed on first use) the category scores, so
+encode_query(), token pruning and category routing share one pass.
 """
 
+import hashlib
+import json
+import multiprocessing
 import re
+from dataclasses import dataclass
+from functools import cached_property
 from typing import List
 
 
+# Bump when _preprocess(), extract_keywords(), infer_category() or
+# encoder.entry_to_record() change what they return for the same input —
+# persisted index snapshots encoded under another version are then stale.
+PREPROCESS_VERSION = 1
+
+
 # ---------------------------------------------------------------------------
 # Category signal lists — keyword → FAQ category mapping
 # ---------------------------------------------------------------------------
@@ -118,17 +133,97 @@ _STOPWORDS = frozenset([
 ])
 
 
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
 def _preprocess(text: str) -> str:
     """Lowercase and normalise punctuation for consistent BoW encoding."""
-    return re.sub(r"[^\w\s]", " ", text.lower()).strip()
+    return _PUNCTUATION.sub(" ", text.lower()).strip()
+
+
+def _keywords(words: list[str]) -> list[str]:
+    """Cleaned words minus stopwords and single characters."""
+    return [w for w in words if w not in _STOPWORDS and len(w) > 1]
 
 
 def extract_keywords(text: str) -> str:
     """Extract meaningful keywords from text, filtering stopwords."""
-    cleaned = _preprocess(text)
-    words = cleaned.split()
-    keywords = [w for w in words if w not in _STOPWORDS and len(w) > 1]
-    return " ".join(keywords)
+    return " ".join(_keywords(_preprocess(text).split()))
+
+
+# ---------------------------------------------------------------------------
+# Signal matcher — word lookups for single-word signals, a trie for phrases
+# ---------------------------------------------------------------------------
+
+_WORD_RUN = re.compile(r"\w+")
+_BOUNDARY = re.compile(r"\b")
+
+
+def _split_signals() -> tuple[dict[str, list[str]], dict]:
+    """(single-word signal → categories, trie over the remaining phrases).
+
+    A single-word signal matches with \\b on both sides exactly when it
+    equals one of the text's maximal \\w+ runs, so those are looked up in
+    a dict. Phrases (several words, or punctuation such as "config.yaml")
+    go into a character trie; the "" entry of the node where a phrase ends
+    lists its categories. Categories repeat once per listing.
+    """
+    words: dict[str, list[str]] = {}
+    trie: dict = {}
+    for cat, signals in _CATEGORY_SIGNALS.items():
+        for signal in signals:
+            if _WORD_RUN.fullmatch(signal):
+                words.setdefault(signal, []).append(cat)
+                continue
+            node = trie
+            for ch in signal:
+                node = node.setdefault(ch, {})
+            node.setdefault("", []).append(cat)
+    return words, trie
+
+
+_SIGNAL_WORDS, _PHRASE_TRIE = _split_signals()
+
+
+def _is_word(ch: str) -> bool:
+    """Whether re's \\w matches `ch` (str patterns are Unicode-aware)."""
+    return ch.isalnum() or ch == "_"
+
+
+def _phrase_categories(lower: str) -> list[list[str]]:
+    """Category lists of the distinct phrase signals found in lowercased text."""
+    n     = len(lower)
+    found: dict[int, list[str]] = {}
+    for boundary in _BOUNDARY.finditer(lower):
+        node = _PHRASE_TRIE
+        for end in range(boundary.start(), n):
+            node = node.get(lower[end])
+            if node is None:
+                break
+            cats = node.get("")
+            if cats is None:
+                continue
+            if _is_word(lower[end]) != (end + 1 < n and _is_word(lower[end + 1])):
+                found[id(node)] = cats                 # \b after the phrase
+    return list(found.values())
+
+
+def _category_signal_counts(lower: str) -> dict[str, int]:
+    """Number of word-boundary signal hits per category in lowercased text.
+
+    Equivalent to one re.search(r"\\b" + re.escape(signal) + r"\\b") per
+    signal. Single-word signals are a set lookup per distinct word of the
+    text; phrases take one trie walk from each word boundary.
+    """
+    counts = dict.fromkeys(_CATEGORY_SIGNALS, 0)
+    for token in set(_WORD_RUN.findall(lower)):
+        for cat in _SIGNAL_WORDS.get(token, ()):
+            counts[cat] += 1
+    if _PHRASE_TRIE:
+        for cats in _phrase_categories(lower):
+            for cat in cats:
+                counts[cat] += 1
+    return counts
 
 
 def infer_category(text: str) -> str:
@@ -139,14 +234,183 @@ def infer_category(text: str) -> str:
     Uses word-boundary matching to avoid substring collisions
     (e.g. "glyph" must not match inside "glyphh").
     """
-    lower = text.lower()
+    return _best_category(_category_signal_counts(text.lower()))
+
+
+def _best_category(counts: dict[str, int]) -> str:
+    """First category with the most signal hits, or 'general' if none hit."""
     best_cat, best_score = "general", 0
-    for cat, signals in _CATEGORY_SIGNALS.items():
-        score = sum(
-            1 for s in signals
-            if re.search(r"\b" + re.escape(s) + r"\b", lower)
-        )
+    for cat, score in counts.items():
         if score > best_score:
             best_score = score
             best_cat = cat
     return best_cat
+
+
+def has_category_signal(text: str) -> bool:
+    """True if any category signal occurs in text (infer_category didn't fall back)."""
+    return any(_category_signal_counts(text.lower()).values())
+
+
+# ---------------------------------------------------------------------------
+# Category score distribution and routing decision
+# ---------------------------------------------------------------------------
+
+def category_scores(text: str) -> dict[str, int]:
+    """Signal hits per category for text, every category included.
+
+    The counts infer_category() takes its argmax of; rank_categories() and
+    category_margin() read the rest of the distribution from them.
+    """
+    return _category_signal_counts(text.lower())
+
+
+def rank_categories(counts: dict[str, int]) -> list[tuple[str, int]]:
+    """(category, hits) for every category with a hit, best first.
+
+    Ties keep _CATEGORY_SIGNALS order, so the head is infer_category().
+    """
+    hit = [(cat, n) for cat, n in counts.items() if n > 0]
+    return sorted(hit, key=lambda item: -item[1])
+
+
+def category_margin(counts: dict[str, int]) -> int:
+    """Hits of the best category minus the runner-up (0 for a tie or no signal)."""
+    ranked = rank_categories(counts) + [("", 0), ("", 0)]
+    return ranked[0][1] - ranked[1][1]
+
+
+def route_categories(counts: dict[str, int], margin: int = 0) -> tuple[str, ...]:
+    """Categories to restrict a search to: one, the top two, or () for all.
+
+    The best category alone when it leads the runner-up by at least
+    `margin` hits; otherwise the top two when the runner-up (and so the
+    best) leads the third by `margin`; otherwise a full scan. margin=0
+    always picks one category (infer_category()) when there is any signal.
+    """
+    ranked = rank_categories(counts)
+    if not ranked:
+        return ()
+    hits = [n for _, n in ranked] + [0, 0]
+    if hits[0] - hits[1] >= margin:
+        return (ranked[0][0],)
+    if len(ranked) >= 2 and hits[1] - hits[2] >= margin:
+        return (ranked[0][0], ranked[1][0])
+    return ()
+
+
+# ---------------------------------------------------------------------------
+# QueryAnalysis — one tokenization shared by encoding, pruning and routing
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    """One text, tokenized once.
+
+    `signal_text` is the lowercased text the category signals are matched
+    in: the cleaned text for queries, the raw text for corpus entries (see
+    analyze()). Category scores are computed on first access.
+    """
+    text:        str
+    cleaned:     str
+    tokens:      tuple[str, ...]
+    keywords:    tuple[str, ...]
+    signal_text: str
+
+    @property
+    def keyword_text(self) -> str:
+        """Keywords joined by spaces, as extract_keywords() returns them."""
+        return " ".join(self.keywords)
+
+    @cached_property
+    def category_counts(self) -> dict[str, int]:
+        """Signal hits per category, in _CATEGORY_SIGNALS order."""
+        return _category_signal_counts(self.signal_text)
+
+    @cached_property
+    def category(self) -> str:
+        """infer_category() of the text."""
+        return _best_category(self.category_counts)
+
+    @property
+    def has_signal(self) -> bool:
+        """has_category_signal() of the text."""
+        return any(self.category_counts.values())
+
+    @property
+    def category_margin(self) -> int:
+        """category_margin() of the category counts."""
+        return category_margin(self.category_counts)
+
+    def route_categories(self, margin: int = 0) -> tuple[str, ...]:
+        """route_categories() of the category counts."""
+        return route_categories(self.category_counts, margin)
+
+
+def analyze(text: "str | QueryAnalysis", raw_signals: bool = False) -> QueryAnalysis:
+    """Tokenize `text` once for encode_query(), pruning and routing.
+
+    Category signals are matched in the cleaned text, as encode_query()
+    does, or with raw_signals=True in the lowercased raw text, as
+    entry_to_record() does (punctuation inside signals such as
+    "config.yaml" then still matches). A QueryAnalysis is returned as is.
+    """
+    if isinstance(text, QueryAnalysis):
+        return text
+    lower   = text.lower()
+    cleaned = _PUNCTUATION.sub(" ", lower).strip()
+    tokens  = cleaned.split()
+    return QueryAnalysis(
+        text=text,
+        cleaned=cleaned,
+        tokens=tuple(tokens),
+        keywords=tuple(_keywords(tokens)),
+        signal_text=lower if raw_signals else cleaned,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Batch variants for bulk builds
+# ---------------------------------------------------------------------------
+
+# Below this many distinct texts a process pool costs more than it saves.
+POOL_MIN_TEXTS = 20_000
+
+
+def _map_distinct(func, texts: list[str], processes: int) -> list:
+    """func over each distinct text once, optionally in a process pool."""
+    distinct = list(dict.fromkeys(texts))
+    if processes > 1 and len(distinct) >= POOL_MIN_TEXTS:
+        chunksize = max(1, len(distinct) // (processes * 8))
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(func, distinct, chunksize)
+    else:
+        results = [func(text) for text in distinct]
+    if len(distinct) == len(texts):
+        return results
+    lookup = dict(zip(distinct, results))
+    return [lookup[text] for text in texts]
+
+
+def infer_categories(texts: list[str], processes: int = 0) -> list[str]:
+    """infer_category() of every text.
+
+    Repeated texts are scanned once, and with processes > 1 a large batch is
+    split across a process pool.
+    """
+    return _map_distinct(infer_category, list(texts), processes)
+
+
+def extract_keywords_many(texts: list[str], processes: int = 0) -> list[str]:
+    """extract_keywords() of every text, batched like infer_categories()."""
+    return _map_distinct(extract_keywords, list(texts), processes)
+
+
+def rules_fingerprint() -> str:
+    """Digest of the preprocessing rules: PREPROCESS_VERSION, stopwords, signals."""
+    rules = {
+        "version":   PREPROCESS_VERSION,
+        "stopwords": sorted(_STOPWORDS),
+        "signals":   list(_CATEGORY_SIGNALS.items()),   # order breaks ties
+    }
+    return hashlib.sha256(json.dumps(rules).encode()).hexdigest()
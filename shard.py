@@ -0,0 +1,405 @@
+"""
+Multi-process serving: sharded scatter-gather and shared-memory replicas.
+
+Exports:
+  assign_shards(metadata, n_shards, by) — global rows per shard, by a stable
+                                          hash of question_id or by category
+  build_shards(encoder, glyphs, directory, n_shards, by, **options) — one
+                                          index file per shard plus a manifest
+  ShardedIndex — FAQIndex-compatible search() over shard workers
+  ReplicaPool — whole-index workers attached to one shared-memory copy
+
+Each shard is an ordinary store.py index file, opened with mmap by its own
+worker process, so no process holds or scans the whole corpus. A query is
+sent to every worker, each returns its local top-k with global row ids, and
+the parent merges them by (score desc, global row) — the same order
+select_top_k() gives on a single index, so the merged top-k is identical.
+
+Routing can't be decided per shard: whether the query stays in its category
+partition depends on the best in-partition score across all shards. Workers
+therefore run with route=False and return both their overall top-k and their
+top-k within the query's partition; the parent applies the route_threshold
+rule of FAQIndex.search() to the merged partition results.
+
+processes=False serves the same shards in-process, which keeps the merge
+logic testable without worker start-up.
+
+When the corpus fits one process but a single core doesn't keep up,
+ReplicaPool runs whole-index workers instead. They attach to one
+shared-memory copy of the index file (store.share_index()), so adding
+workers adds neither memory nor encoding work.
+"""
+
+import heapq
+import json
+import multiprocessing
+import time
+import zlib
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from glyphh.core.types import Glyph
+from glyphh.encoder import Encoder
+
+from index import FAQIndex, default_min_candidates, load_similarity_config, select_top_k
+from intent import analyze
+from store import attach_index, open_index, read_header, share_index, write_index
+
+MANIFEST = "manifest.json"
+
+# One search hit as sent between processes: (score, global row, metadata).
+Hit = tuple[float, int, dict[str, Any]]
+
+
+def assign_shards(metadata: list[dict], n_shards: int, by: str = "hash") -> list[np.ndarray]:
+    """Sorted global rows for each of n_shards shards.
+
+    by="hash" uses crc32(question_id), so an entry's shard never depends on
+    the rest of the corpus. by="category" keeps each category whole, placing
+    the largest categories first on the least-loaded shard.
+    """
+    if by == "hash":
+        keys = [zlib.crc32(m["question_id"].encode()) % n_shards for m in metadata]
+        return [np.flatnonzero(np.array(keys) == s) for s in range(n_shards)]
+    if by == "category":
+        cats = np.array([m.get("category", "") for m in metadata], dtype=object)
+        groups = sorted(
+            (np.flatnonzero(cats == c) for c in dict.fromkeys(cats)),
+            key=lambda rows: (-len(rows), rows[0]),
+        )
+        shards: list[list[np.ndarray]] = [[] for _ in range(n_shards)]
+        loads = [(0, s) for s in range(n_shards)]
+        for rows in groups:
+            load, s = heapq.heappop(loads)
+            shards[s].append(rows)
+            heapq.heappush(loads, (load + len(rows), s))
+        return [
+            np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            for parts in shards
+        ]
+    raise ValueError(f"Unknown shard key {by!r}, expected 'hash' or 'category'")
+
+
+def build_shards(encoder, glyphs: list[tuple[Glyph, dict]], directory: Path,
+                 n_shards: int, by: str = "hash", data: str | None = None,
+                 **options) -> Path:
+    """Write one index file per non-empty shard and return the manifest path.
+
+    `options` go to FAQIndex.from_glyphs(), e.g. hierarchical=True to store
+    each shard's coarse vectors.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    shards = []
+    for s, rows in enumerate(assign_shards([m for _, m in glyphs], n_shards, by)):
+        if not len(rows):
+            continue
+        name  = f"shard-{s:03d}"
+        index = FAQIndex.from_glyphs(
+            encoder, [glyphs[r] for r in rows], codebook=True, **options,
+        )
+        write_index(index, directory / f"{name}.index", data)
+        np.save(directory / f"{name}.rows.npy", rows.astype(np.int64))
+        shards.append({"index": f"{name}.index", "rows": f"{name}.rows.npy",
+                       "n_entries": int(len(rows))})
+    manifest = {"n_shards": n_shards, "by": by, "n_entries": len(glyphs), "shards": shards}
+    path = directory / MANIFEST
+    path.write_text(json.dumps(manifest, indent=2))
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Shard workers
+# ---------------------------------------------------------------------------
+
+class _Shard:
+    """One opened shard: local search with results keyed by global row."""
+
+    def __init__(self, encoder, directory: Path, spec: dict, mode: str, options: dict):
+        self.index = open_index(encoder, directory / spec["index"], mode, **options)
+        self.rows  = np.load(directory / spec["rows"], mmap_mode="r")
+
+    def _top(self, q_roles: dict[str, np.ndarray], rows: np.ndarray | None,
+             k: int) -> list[Hit]:
+        scores, scope = self.index._search_rows(q_roles, rows, k)
+        return [
+            (float(scores[i]), int(self.rows[scope[i]]), self.index.metadata[scope[i]])
+            for i in select_top_k(scores, k, scope)
+        ]
+
+    def search(self, query: str, k: int, route: bool,
+               fallback: bool = False) -> tuple[list[Hit], list[Hit] | None, int | None]:
+        """(top-k over the shard, top-k within the query's partition or None,
+        number of candidate rows or None for a full scan).
+
+        Candidates never fall back to a full scan here; ShardedIndex applies
+        min_candidates to the total and asks again with fallback=True.
+        """
+        index   = self.index
+        query   = analyze(query)
+        q_roles = index.encode_query(query)
+        rows    = index.candidates(query, q_roles, fallback)
+        index.stage_ms = {"coarse": 0.0, "fine": 0.0}
+        in_part = None
+        if route:
+            part = index.category_rows(query)
+            if part is not None:
+                first = part if rows is None else np.intersect1d(part, rows)
+                in_part = self._top(q_roles, first, k) if len(first) else []
+        n_rows = None if rows is None else len(rows)
+        return self._top(q_roles, rows, k), in_part, n_rows
+
+    def search_many(self, queries: list[str], k: int, route: bool,
+                    fallback: bool = False) -> list:
+        return [self.search(q, k, route, fallback) for q in queries]
+
+
+def _serve(conn, config, factory, args: tuple, kwargs: dict) -> None:
+    """Worker process loop: build factory(encoder, *args, **kwargs), then
+    answer (method, args) requests on it until sent None."""
+    try:
+        target = factory(Encoder(config), *args, **kwargs)
+    except Exception as exc:            # re-raised by _Workers.start()
+        conn.send(("error", exc))
+        return
+    conn.send(("ok", None))
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, call_args = request
+        try:
+            conn.send(("ok", getattr(target, method)(*call_args)))
+        except Exception as exc:
+            conn.send(("error", exc))
+    conn.close()
+
+
+class _Workers:
+    """Worker processes running _serve(), one pipe each."""
+
+    def __init__(self):
+        self._workers: list[tuple[Any, Any]] = []
+
+    def start(self, encoder, factory, calls: list[tuple[tuple, dict]]) -> None:
+        """One worker per (args, kwargs) in `calls`; waits until all are ready."""
+        ctx = multiprocessing.get_context("spawn")
+        for args, kwargs in calls:
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=_serve, args=(child, encoder.config, factory, args, kwargs), daemon=True,
+            )
+            proc.start()
+            child.close()
+            self._workers.append((parent, proc))
+        for parent, _ in self._workers:
+            status, exc = parent.recv()
+            if status == "error":
+                self.close()
+                raise exc
+
+    def __len__(self) -> int:
+        return len(self._workers)
+
+    def send(self, worker: int, method: str, *args) -> None:
+        self._workers[worker][0].send((method, args))
+
+    def recv(self, worker: int):
+        status, value = self._workers[worker][0].recv()
+        if status == "error":
+            raise value
+        return value
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        for parent, proc in self._workers:
+            try:
+                parent.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            proc.join(timeout=5)
+            parent.close()
+        self._workers = []
+
+
+# ---------------------------------------------------------------------------
+# ShardedIndex — scatter the query, gather the per-shard top-k
+# ---------------------------------------------------------------------------
+
+class ShardedIndex:
+    """Search over the shards of a build_shards() manifest.
+
+    With processes=True each shard is opened and scored by its own worker
+    process; otherwise the shards are served in-process. search() and
+    search_many() return the same (score, metadata) lists as FAQIndex.
+    Hierarchical shards keep coarse_limit() survivors each, so together they
+    rerank at least as many rows as one hierarchical index would.
+    """
+
+    def __init__(self, encoder, manifest: Path, mode: str = "roles",
+                 processes: bool = True, route: bool = False,
+                 route_threshold: float = 0.40, top_k: int | None = None, **options):
+        manifest   = Path(manifest)
+        spec       = json.loads(manifest.read_text())
+        directory  = manifest.parent
+        self.route = route
+        self.route_threshold = route_threshold
+        self.top_k     = top_k if top_k is not None else int(
+            load_similarity_config().get("top_k", 1)
+        )
+        self.min_candidates = options.get("min_candidates")
+        if self.min_candidates is None:
+            self.min_candidates = default_min_candidates(self.top_k)
+        self.n_entries = spec["n_entries"]
+        self.stage_ms: dict[str, float] = {}
+        self._local: list[_Shard] = []
+        self._workers = _Workers()
+        # Shards don't route, but a hierarchical shard's full-scan fallback
+        # is keyed to the same threshold.
+        options = dict(options, route_threshold=route_threshold)
+        if processes:
+            self._workers.start(encoder, _Shard, [
+                ((directory, s, mode, options), {}) for s in spec["shards"]
+            ])
+        else:
+            self._local = [
+                _Shard(encoder, directory, s, mode, options) for s in spec["shards"]
+            ]
+
+    def __len__(self) -> int:
+        return self.n_entries
+
+    def __enter__(self) -> "ShardedIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self._workers.close()
+
+    def _scatter(self, method: str, *args) -> list:
+        """Run one _Shard method on every shard and collect the replies."""
+        if self._local:
+            return [getattr(shard, method)(*args) for shard in self._local]
+        for w in range(len(self._workers)):
+            self._workers.send(w, method, *args)
+        return [self._workers.recv(w) for w in range(len(self._workers))]
+
+    def _gather(self, per_shard: list[tuple], k: int) -> list[tuple[float, dict[str, Any]]]:
+        """Merge per-shard top-k lists into the global top-k."""
+        parts = [part for _, part, _ in per_shard if part is not None]
+        if parts and any(s >= self.route_threshold for part in parts for s, _, _ in part):
+            hits = [h for part in parts for h in part]
+        else:
+            hits = [h for overall, _, _ in per_shard for h in overall]
+        hits.sort(key=lambda h: (-h[0], h[1]))
+        return [(score, meta) for score, _, meta in hits[:k]]
+
+    def _too_few(self, per_shard: list[tuple]) -> bool:
+        """Whether the candidate stages left fewer than min_candidates rows overall."""
+        counts = [n for _, _, n in per_shard]
+        if any(n is None for n in counts):
+            return False
+        return sum(counts) < max(self.min_candidates, 1)
+
+    def search(self, query: str,
+               top_k: int | None = None) -> list[tuple[float, dict[str, Any]]]:
+        """Score a raw question on every shard and return the global top_k."""
+        k     = self.top_k if top_k is None else top_k
+        start = time.perf_counter()
+        per_shard = self._scatter("search", query, k, self.route)
+        if self._too_few(per_shard):
+            per_shard = self._scatter("search", query, k, self.route, True)
+        self.stage_ms = {"scatter": (time.perf_counter() - start) * 1000}
+        return self._gather(per_shard, k)
+
+    def search_many(self, queries: list[str],
+                    top_k: int | None = None) -> list[list[tuple[float, dict[str, Any]]]]:
+        """Batch search(): one round trip per shard for the whole batch."""
+        k       = self.top_k if top_k is None else top_k
+        replies = self._scatter("search_many", queries, k, self.route)
+        results = []
+        for qi, query in enumerate(queries):
+            per_shard = [reply[qi] for reply in replies]
+            if self._too_few(per_shard):
+                per_shard = self._scatter("search", query, k, self.route, True)
+            results.append(self._gather(per_shard, k))
+        return results
+
+
+# ---------------------------------------------------------------------------
+# ReplicaPool — whole-corpus workers over one shared-memory copy
+# ---------------------------------------------------------------------------
+
+class ReplicaPool:
+    """Worker processes that each serve the whole index from shared memory.
+
+    The index file is copied once into multiprocessing.shared_memory and
+    every worker attaches to it with store.attach_index(), so the role
+    matrices, metadata and codebook exist once however many workers run,
+    and no worker encodes anything. search() goes to the next worker in
+    turn; search_many() splits the batch across all of them.
+    """
+
+    def __init__(self, encoder, path: Path, workers: int = 2, mode: str = "roles",
+                 top_k: int | None = None, **options):
+        self.top_k  = top_k if top_k is not None else int(
+            load_similarity_config().get("top_k", 1)
+        )
+        self.stage_ms: dict[str, float] = {}
+        self.block  = share_index(path)
+        self.n_entries = read_header(self.block.buf)["n_entries"]
+        self._next  = 0
+        self._workers = _Workers()
+        try:
+            self._workers.start(encoder, attach_index, [
+                ((self.block.name, mode), dict(options, top_k=self.top_k))
+            ] * workers)
+        except Exception:
+            self._release()
+            raise
+
+    def __len__(self) -> int:
+        return self.n_entries
+
+    def __enter__(self) -> "ReplicaPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _release(self) -> None:
+        self.block.close()
+        self.block.unlink()
+
+    def close(self) -> None:
+        """Stop the workers and free the shared block."""
+        if self.block is not None:
+            self._workers.close()
+            self._release()
+            self.block = None
+
+    def search(self, query: str,
+               top_k: int | None = None) -> list[tuple[float, dict[str, Any]]]:
+        """FAQIndex.search() on the next worker."""
+        w = self._next
+        self._next = (w + 1) % len(self._workers)
+        self._workers.send(w, "search", query, top_k)
+        return self._workers.recv(w)
+
+    def search_many(self, queries: list[str],
+                    top_k: int | None = None) -> list[list[tuple[float, dict[str, Any]]]]:
+        """FAQIndex.search_many() with the batch split evenly across workers."""
+        n      = len(self._workers)
+        chunks = [queries[w::n] for w in range(n)]
+        for w, chunk in enumerate(chunks):
+            if chunk:
+                self._workers.send(w, "search_many", chunk, top_k)
+        parts = [self._workers.recv(w) if chunk else [] for w, chunk in enumerate(chunks)]
+        results: list = [None] * len(queries)
+        for w, part in enumerate(parts):
+            results[w::n] = part
+        return results
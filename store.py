@@ -0,0 +1,521 @@
+"""
+Memory-mapped on-disk format for a built FAQIndex.
+
+Exports:
+  write_index(index, path, data_digest) — serialise an index snapshot
+  open_index(encoder, path, mode, **options) — FAQIndex over a mapped file
+  share_index(path) — copy an index file into a named shared-memory block
+  attach_index(encoder, name, mode, **options) — FAQIndex over that block
+  load_or_build(encoder, path, records, ...) — open a snapshot, rebuilding
+                                              it if stale or missing
+  check_snapshot(header, encoder, ...) — reasons a snapshot is stale
+  data_digest(entries) — digest of the source JSONL entries
+  SnapshotMismatch — raised when a snapshot doesn't match the running code
+  CorruptSnapshot — SnapshotMismatch for a truncated or unreadable file
+  LazyRecords — read-only record sequence decoded on access, with a write
+                overlay for upserts
+  MappedPostings — TokenPostings read from the file on first use
+
+File layout (little-endian):
+
+  magic    8 bytes  b"FAQIDX\\0\\1"
+  length   uint64   byte length of the JSON header
+  header   JSON     format version, snapshot fingerprints (below), n_entries,
+                    role weights, category names, and the dtype / shape /
+                    offset of every array below
+  arrays   each aligned to 64 bytes:
+             matrices/<role>  float32 (n, dim)   bipolar role vectors
+             packed/<role>    uint64  (n, words) the same, 1 bit per dim
+             fused            float32 (n, width) fuse_roles() rows
+             coarse           float32 (n, dim)   cortex at coarse_path (optional)
+             category_codes   int32   (n,)       index into header categories
+             digests          S64     (n,)       entry_digest() per row
+             metadata_offsets int64   (n + 1,)   into metadata (JSON per row)
+             tokens_offsets   int64   (n + 1,)   into tokens (JSON list per row)
+             metadata, tokens uint8              concatenated UTF-8 JSON
+             codebook_vectors int8    (words, dim) WordCodebook lemma vectors
+             codebook_words   uint8              JSON [[word, lemma], ...]
+
+A snapshot is only valid for the code that encoded it. The header records
+FORMAT_VERSION, the encoder config fingerprint, intent.rules_fingerprint()
+(preprocessing rules), the Pattern A role weights baked into the fused
+vectors, and optionally the digest of the source data. open_index() checks
+them all and raises SnapshotMismatch — or CorruptSnapshot when the file
+can't be parsed at all; load_or_build() rebuilds instead.
+
+open_index() maps the file read-only and hands NumPy views of it straight
+to FAQIndex, so start-up cost is page faults rather than Encoder.encode()
+calls. Metadata is JSON-decoded per row on access and the token postings
+on first use. Structures that depend on query-time options (LSH tables,
+lookups, the word table) are derived after opening, exactly as after
+FAQIndex.from_glyphs().
+
+share_index() places the same file image in multiprocessing.shared_memory
+for serving workers that should not depend on a file on local disk; each
+worker's attach_index() views the one copy, so memory stays at one corpus
+however many workers attach.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+from index import (
+    ROLE_WEIGHTS, FAQIndex, TokenPostings, digest_entries, fuse_roles, pack_bipolar,
+)
+from intent import rules_fingerprint
+
+MAGIC = b"FAQIDX\0\1"
+ALIGN = 64
+
+# Bump when the file layout or header keys change.
+FORMAT_VERSION = 2
+
+
+class SnapshotMismatch(ValueError):
+    """An index snapshot was written by different code, config or data."""
+
+
+class CorruptSnapshot(SnapshotMismatch):
+    """An index file is truncated, or its header or arrays can't be parsed."""
+
+
+def config_fingerprint(encoder) -> str:
+    """Digest of the encoder config the stored vectors were encoded with."""
+    return hashlib.sha256(encoder.config.to_json().encode()).hexdigest()
+
+
+def data_digest(entries: list[dict]) -> str:
+    """Order-sensitive digest of the source JSONL entries."""
+    h = hashlib.sha256()
+    for entry in entries:
+        h.update(json.dumps(entry, sort_keys=True).encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def check_snapshot(header: dict, encoder, role_weights: dict[str, float] | None = None,
+                   data: str | None = None,
+                   coarse_path: tuple[str, ...] | None = None) -> list[str]:
+    """Why a snapshot header is stale for the running code (empty if it isn't).
+
+    The data digest is only compared when `data` is given, the coarse
+    vectors only when a hierarchical index needs them at `coarse_path`.
+    """
+    reasons = []
+    if header.get("format_version") != FORMAT_VERSION:
+        reasons.append(
+            f"file format {header.get('format_version')} != {FORMAT_VERSION}"
+        )
+        return reasons
+    if header["config_fingerprint"] != config_fingerprint(encoder):
+        reasons.append("encoder config changed")
+    if header["rules_fingerprint"] != rules_fingerprint():
+        reasons.append("preprocessing rules changed")
+    if header["role_weights"] != dict(role_weights or ROLE_WEIGHTS):
+        reasons.append("role weights changed")
+    if data is not None and header["data_digest"] != data:
+        reasons.append("source data changed")
+    if coarse_path is not None and header["coarse_path"] != list(coarse_path):
+        reasons.append(f"no coarse vectors at {list(coarse_path)}")
+    return reasons
+
+
+class LazyRecords(Sequence):
+    """Sequence of `n` records produced by decode(i) on access.
+
+    Assignments and appends go to an in-memory overlay, so a mapped index
+    can still be upserted into. `categories`, when given, is the per-row
+    category array used to build routing partitions without decoding rows.
+    """
+
+    def __init__(self, decode: Callable[[int], Any], n: int,
+                 categories: np.ndarray | None = None):
+        self._decode   = decode
+        self._n        = n
+        self._changed: dict[int, Any] = {}
+        self._appended: list = []
+        self._categories = categories
+
+    def __len__(self) -> int:
+        return self._n + len(self._appended)
+
+    def _index(self, i) -> int:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return i
+
+    def __getitem__(self, i):
+        i = self._index(i)
+        if i >= self._n:
+            return self._appended[i - self._n]
+        if i in self._changed:
+            return self._changed[i]
+        return self._decode(i)
+
+    def __setitem__(self, i, value) -> None:
+        i = self._index(i)
+        if i >= self._n:
+            self._appended[i - self._n] = value
+        else:
+            self._changed[i] = value
+
+    def append(self, value) -> None:
+        self._appended.append(value)
+
+    @property
+    def categories(self) -> np.ndarray | None:
+        if self._categories is None:
+            return None
+        if not self._changed and not self._appended:
+            return self._categories
+        cats = np.concatenate([
+            self._categories,
+            np.array([m.get("category", "") for m in self._appended], dtype=object),
+        ])
+        for i, m in self._changed.items():
+            cats[i] = m.get("category", "")
+        return cats
+
+
+class MappedPostings(TokenPostings):
+    """TokenPostings filled from the per-row token blob on first use."""
+
+    def __init__(self, decode: Callable[[int], list[str]], n: int):
+        self._pending = (decode, n)
+        super().__init__()
+
+    def _load(self) -> None:
+        if self._pending is None:
+            return
+        decode, n = self._pending
+        self._pending = None
+        for row in range(n):
+            TokenPostings.add(self, row, set(decode(row)))
+
+    @property
+    def postings(self) -> dict[str, set[int]]:
+        self._load()
+        return self._postings
+
+    @postings.setter
+    def postings(self, value: dict[str, set[int]]) -> None:
+        self._postings = value
+
+    @property
+    def row_tokens(self) -> dict[int, frozenset[str]]:
+        self._load()
+        return self._row_tokens
+
+    @row_tokens.setter
+    def row_tokens(self, value: dict[int, frozenset[str]]) -> None:
+        self._row_tokens = value
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+def _json_blob(items: list) -> tuple[np.ndarray, np.ndarray]:
+    """(offsets, uint8 bytes) for one compact JSON document per item."""
+    encoded = [json.dumps(item, separators=(",", ":")).encode() for item in items]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def write_index(index: FAQIndex, path: Path, data: str | None = None) -> Path:
+    """Write `index` (live rows only) to `path` atomically; returns the path.
+
+    `data` is the data_digest() of the entries the index was built from.
+    """
+    path = Path(path)
+    live = index.live_rows()
+    rows = live if len(live) != len(index) else slice(None)
+
+    arrays: dict[str, np.ndarray] = {}
+    matrices = {r: index.role_matrix(r)[rows] for r in index.role_weights}
+    for rname, matrix in matrices.items():
+        arrays[f"matrices/{rname}"] = matrix
+        arrays[f"packed/{rname}"]   = (
+            index.packed[rname][rows] if rname in index.packed else pack_bipolar(matrix)
+        )
+    arrays["fused"] = (
+        index.fused[rows] if index.fused is not None
+        else fuse_roles(matrices, index.role_weights, index.dimension)
+    )
+    if index.coarse is not None:
+        arrays["coarse"] = index.coarse[rows]
+
+    metadata   = [index.metadata[r] for r in live]
+    categories = list(dict.fromkeys(m.get("category", "") for m in metadata))
+    code_of    = {c: i for i, c in enumerate(categories)}
+    arrays["category_codes"] = np.array(
+        [code_of[m.get("category", "")] for m in metadata], dtype=np.int32,
+    )
+    digests = [index.entry_digests[r] for r in live]
+    arrays["digests"] = np.array(digests, dtype="S64")
+    arrays["metadata_offsets"], arrays["metadata"] = _json_blob(metadata)
+    arrays["tokens_offsets"], arrays["tokens"] = _json_blob([
+        sorted(index.postings.row_tokens.get(int(r), ())) for r in live
+    ])
+    if index.codebook is not None and len(index.codebook):
+        words = list(index.codebook.words.items())
+        arrays["codebook_vectors"] = np.stack([vec for _, (_, vec) in words]).astype(np.int8)
+        _, arrays["codebook_words"] = _json_blob([[[w, lemma] for w, (lemma, _) in words]])
+
+    header = {
+        "format_version":     FORMAT_VERSION,
+        "dimension":          index.dimension,
+        "n_entries":          len(live),
+        "role_weights":       index.role_weights,
+        "config_fingerprint": config_fingerprint(index.encoder),
+        "rules_fingerprint":  rules_fingerprint(),
+        "data_digest":        data,
+        "corpus_digest":      digest_entries(digests),     # of the rows written
+        "coarse_path":        list(index.coarse_path) if index.coarse is not None else None,
+        "categories":         categories,
+        "arrays":             {},
+    }
+
+    relative, offset = {}, 0
+    for name, array in arrays.items():
+        arrays[name]   = np.ascontiguousarray(array)
+        relative[name] = offset
+        offset = _aligned(offset + arrays[name].nbytes)
+
+    # Array offsets are absolute, so grow the header area until the header
+    # (which contains them) fits in front of the data.
+    data_start = _aligned(len(MAGIC) + 8)
+    while True:
+        header["arrays"] = {
+            name: {
+                "dtype":  array.dtype.str,
+                "shape":  list(array.shape),
+                "offset": data_start + relative[name],
+            }
+            for name, array in arrays.items()
+        }
+        blob = json.dumps(header).encode()
+        if len(MAGIC) + 8 + len(blob) <= data_start:
+            break
+        data_start = _aligned(len(MAGIC) + 8 + len(blob))
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(blob)).tobytes())
+        f.write(blob)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Opening
+# ---------------------------------------------------------------------------
+
+def read_header(buf) -> dict:
+    """The JSON header of a mapped (or read) index file.
+
+    Raises CorruptSnapshot if the file is too short or the header unreadable.
+    """
+    start = len(MAGIC) + 8
+    if len(buf) < start or bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise CorruptSnapshot("Not a FAQ index file (bad magic)")
+    length = int(np.frombuffer(buf, dtype=np.uint64, count=1, offset=len(MAGIC))[0])
+    if start + length > len(buf):
+        raise CorruptSnapshot(f"Truncated index header ({len(buf)} bytes, needs {start + length})")
+    try:
+        header = json.loads(bytes(buf[start:start + length]))
+    except ValueError as exc:
+        raise CorruptSnapshot(f"Unreadable index header: {exc}") from exc
+    if not isinstance(header, dict):
+        raise CorruptSnapshot("Unreadable index header: not a JSON object")
+    return header
+
+
+# Header keys and arrays write_index() always writes.
+LAYOUT_KEYS   = ("dimension", "n_entries", "categories", "corpus_digest", "arrays")
+LAYOUT_ARRAYS = ("fused", "category_codes", "digests", "metadata_offsets", "metadata",
+                 "tokens_offsets", "tokens")
+
+
+def _check_layout(header: dict, roles, size: int, source: str) -> None:
+    """Raise CorruptSnapshot unless the header lists every array and each
+    lies within the `size` bytes of the file."""
+    missing = [k for k in LAYOUT_KEYS if k not in header]
+    if missing:
+        raise CorruptSnapshot(f"{source} has a malformed header: missing {missing}")
+    names = list(LAYOUT_ARRAYS) + [f"{kind}/{r}" for r in roles for kind in ("matrices", "packed")]
+    missing = [name for name in names if name not in header["arrays"]]
+    if missing:
+        raise CorruptSnapshot(f"{source} has a malformed header: no arrays {missing}")
+    try:
+        ends = {
+            name: spec["offset"] + np.dtype(spec["dtype"]).itemsize * int(np.prod(spec["shape"]))
+            for name, spec in header["arrays"].items()
+        }
+    except (KeyError, TypeError, ValueError) as exc:
+        raise CorruptSnapshot(f"{source} has a malformed array table: {exc!r}") from exc
+    for name, end in ends.items():
+        if end > size:
+            raise CorruptSnapshot(f"{source} is truncated: {name} ends at byte {end} of {size}")
+
+
+def open_index(encoder, path: Path, mode: str = "roles",
+               role_weights: dict[str, float] | None = None,
+               data: str | None = None, **options) -> FAQIndex:
+    """Open an index file zero-copy; `options` are FAQIndex constructor options.
+
+    Raises SnapshotMismatch if check_snapshot() finds the file stale, and
+    CorruptSnapshot if it is empty, truncated or unparseable.
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise CorruptSnapshot(f"{path} is empty")
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _open_buffer(encoder, buf, str(path), mode, role_weights, data, options)
+
+
+def _open_buffer(encoder, buf, source: str, mode: str,
+                 role_weights: dict[str, float] | None, data: str | None,
+                 options: dict) -> FAQIndex:
+    """FAQIndex over the bytes of an index file held in `buf` (kept alive)."""
+    header  = read_header(buf)
+    index   = FAQIndex(encoder, header.get("role_weights"), mode, **options)
+    try:
+        reasons = check_snapshot(
+            header, encoder, role_weights, data,
+            index.coarse_path if index.hierarchical else None,
+        )
+    except (KeyError, TypeError) as exc:
+        raise CorruptSnapshot(f"{source} has a malformed header: {exc!r}") from exc
+    if reasons:
+        raise SnapshotMismatch(f"{source} is stale: {'; '.join(reasons)}; rebuild it with build.py")
+    _check_layout(header, index.role_weights, len(buf), source)
+
+    def array(name: str) -> np.ndarray | None:
+        spec = header["arrays"].get(name)
+        if spec is None:
+            return None
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        view  = np.frombuffer(buf, dtype=dtype, count=count, offset=spec["offset"])
+        view.flags.writeable = False      # shared-memory buffers are writable
+        return view.reshape(spec["shape"])
+
+    roles = list(index.role_weights)
+    if mode == "packed":
+        index.matrices = {}
+        index.packed = {r: array(f"packed/{r}") for r in roles}
+    else:
+        index.matrices = {r: array(f"matrices/{r}") for r in roles}
+    if mode == "fused":
+        index.fused = array("fused")
+    if index.hierarchical:
+        index.coarse = array("coarse")
+
+    n = header["n_entries"]
+    meta_off, meta = array("metadata_offsets"), array("metadata")
+    categories = np.array(header["categories"], dtype=object)[array("category_codes")]
+    index.metadata = LazyRecords(
+        lambda i: json.loads(meta[meta_off[i]:meta_off[i + 1]].tobytes()), n, categories,
+    )
+    digests = array("digests")
+    index.entry_digests = LazyRecords(lambda i: digests[i].decode(), n)
+    index._row_of = None
+    index._corpus_digest = header["corpus_digest"]
+
+    tok_off, tokens = array("tokens_offsets"), array("tokens")
+    index.postings = MappedPostings(
+        lambda i: json.loads(tokens[tok_off[i]:tok_off[i + 1]].tobytes()), n,
+    )
+    if index.codebook is not None and "codebook_words" in header["arrays"]:
+        vectors = array("codebook_vectors")
+        words   = json.loads(array("codebook_words").tobytes())
+        for (word, lemma), vec in zip(words, vectors):
+            index.codebook.words[word] = (lemma, vec.astype(np.int16))
+
+    index._mmap = buf
+    index._build_derived()
+    return index
+
+
+# ---------------------------------------------------------------------------
+# Shared memory
+# ---------------------------------------------------------------------------
+
+# Blocks attached by this process. They stay mapped until the process exits:
+# closing one while any index still views it would raise BufferError.
+_attached: dict[str, shared_memory.SharedMemory] = {}
+
+
+def share_index(path: Path, name: str | None = None) -> shared_memory.SharedMemory:
+    """Copy an index file into a named shared-memory block.
+
+    The caller owns the block: close() and unlink() it once every worker
+    has detached. Workers attach with attach_index(encoder, block.name).
+    """
+    size  = os.path.getsize(path)
+    block = shared_memory.SharedMemory(name=name, create=True, size=size)
+    with open(path, "rb") as f:
+        f.readinto(block.buf[:size])
+    return block
+
+
+def attach_index(encoder, name: str, mode: str = "roles",
+                 role_weights: dict[str, float] | None = None,
+                 data: str | None = None, **options) -> FAQIndex:
+    """open_index() over a share_index() block: every array is a read-only
+    view of the one shared copy, so attaching costs no encoding or copying.
+
+    Attach from processes started through multiprocessing by the owner;
+    they share its resource tracker, which would otherwise unlink the block
+    when the attaching process exits.
+    """
+    block = _attached.get(name)
+    if block is None:
+        block = _attached[name] = shared_memory.SharedMemory(name=name)
+    return _open_buffer(encoder, block.buf, f"shared index {name}", mode,
+                        role_weights, data, options)
+
+
+def load_or_build(encoder, path: Path, records: Callable[[], list[dict]],
+                  mode: str = "roles", data: str | None = None,
+                  rebuild: bool = True, **options) -> FAQIndex:
+    """open_index(), re-encoding `records()` into a fresh snapshot if needed.
+
+    A missing, stale or corrupt snapshot is rebuilt (entry_to_record()
+    outputs from `records`, written with `data` as its data digest) and then
+    opened; with rebuild=False the SnapshotMismatch (CorruptSnapshot) or
+    FileNotFoundError propagates.
+    """
+    try:
+        return open_index(encoder, path, mode, data=data, **options)
+    except (FileNotFoundError, SnapshotMismatch):
+        if not rebuild:
+            raise
+    # Options that change what the file holds, not just how it is searched.
+    layout = {k: options[k] for k in ("hierarchical", "coarse_path") if k in options}
+    built  = FAQIndex.from_records(
+        encoder, records(), options.get("role_weights"), codebook=True, **layout,
+    )
+    write_index(built, path, data)
+    return open_index(encoder, path, mode, data=data, **options)
@@ -59,3 +59,10 @@ def faq_glyphs(encoder):
             glyph = encoder.encode(concept)
             glyphs.append((glyph, record["metadata"]))
     return glyphs
+
+
+@pytest.fixture(scope="session")
+def faq_index(encoder, faq_glyphs):
+    """Stack the encoded FAQ entries into a vectorized FAQIndex."""
+    from index import FAQIndex
+    return FAQIndex.from_glyphs(encoder, faq_glyphs)
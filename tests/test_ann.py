@@ -0,0 +1,90 @@
+"""Test the LSH candidate backend against exact FAQIndex search."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+from ann import LSHIndex, recall_report, tune_probes
+
+
+@pytest.fixture(scope="module")
+def ann_index(encoder, faq_glyphs):
+    from index import FAQIndex
+    return FAQIndex.from_glyphs(
+        encoder, faq_glyphs, mode="fused", ann=True,
+        ann_options={"n_tables": 8, "n_bits": 6, "n_probes": 2},
+    )
+
+
+def test_lsh_finds_each_entry_in_its_own_bucket(ann_index):
+    lsh = LSHIndex(ann_index.fused, n_tables=4, n_bits=8, n_probes=0)
+    for row in (0, 17, len(ann_index) - 1):
+        assert row in lsh.candidates(ann_index.fused[row])
+
+
+def test_lsh_candidates_shrink_the_corpus(ann_index):
+    q_roles = ann_index.encode_query("how do I deploy Glyphh to Heroku")
+    rows = ann_index.candidates("how do I deploy Glyphh to Heroku", q_roles)
+    assert rows is not None
+    assert 0 < len(rows) < len(ann_index)
+
+
+def test_more_probes_never_lose_candidates(ann_index):
+    from index import fuse_roles
+    q_roles = ann_index.encode_query("what are the pricing tiers")
+    q_fused = fuse_roles(q_roles, ann_index.role_weights, ann_index.dimension)
+    sizes = [len(ann_index.ann.candidates(q_fused, p)) for p in range(4)]
+    assert sizes == sorted(sizes)
+
+
+def test_recall_report_and_tuning(ann_index, test_queries):
+    queries = [q["question"] for q in test_queries]
+    report  = recall_report(ann_index, queries, k=3, probes=(0, 6))
+    assert [r["n_probes"] for r in report] == [0, 6]
+    assert all(0.0 <= r["recall"] <= 1.0 for r in report)
+    assert all(0.0 <= r["fallback_rate"] <= 1.0 for r in report)
+    assert report[1]["recall"] >= report[0]["recall"]
+    assert report[1]["fallback_rate"] <= report[0]["fallback_rate"]
+
+    chosen = tune_probes(ann_index, queries, target_recall=0.9, k=3)
+    assert ann_index.ann.n_probes == chosen["n_probes"]
+    assert chosen["recall"] >= 0.9 or chosen["n_probes"] == ann_index.ann.n_bits
+
+
+def test_recall_report_separates_full_scan_fallbacks(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    sparse  = FAQIndex.from_glyphs(
+        encoder, faq_glyphs, mode="fused", ann=True, min_candidates=1,
+        ann_options={"n_tables": 2, "n_bits": 8, "n_probes": 0},
+    )
+    queries = [q["question"] for q in test_queries]
+    report  = recall_report(sparse, queries, k=3, probes=(0, 8))
+    sparse.ann.n_probes = 0
+    empty = sum(
+        len(sparse.candidates(q, sparse.encode_query(q), fallback=False)) == 0
+        for q in queries
+    )
+    assert report[0]["fallback_rate"] == empty / len(queries) > 0.0
+    assert report[1]["fallback_rate"] <= report[0]["fallback_rate"]
+
+
+def test_result_cache_follows_runtime_ann_changes(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    options = dict(mode="fused", ann=True,
+                   ann_options={"n_tables": 2, "n_bits": 8, "n_probes": 0})
+    cached  = FAQIndex.from_glyphs(encoder, faq_glyphs, result_cache_size=64, **options)
+    plain   = FAQIndex.from_glyphs(encoder, faq_glyphs, **options)
+    queries = [q["question"] for q in test_queries]
+    def accuracy(index):
+        return [(r["recall"], r["fallback_rate"], r["mean_candidates"])
+                for r in recall_report(index, queries, probes=(0, 8))]
+
+    assert accuracy(cached) == accuracy(plain)
+    cached.ann.n_probes = plain.ann.n_probes = 8
+    for q in queries:
+        assert cached.search(q, top_k=3) == plain.search(q, top_k=3)
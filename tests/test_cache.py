@@ -0,0 +1,48 @@
+"""Test the query-glyph and result caches of a FAQIndex."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+import numpy as np
+
+from index import FAQIndex
+
+
+def test_query_cache_reuses_encodings(encoder, faq_glyphs):
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs, query_cache_size=8)
+    first  = index.encode_query("How do I deploy Glyphh to Heroku?")
+    second = index.encode_query("heroku deploy glyphh")
+    assert first is second
+    assert not first["question"].flags.writeable
+    assert index.query_cache.stats()["hits"] == 1
+
+    uncached = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    fresh = uncached.encode_query("heroku deploy glyphh")
+    for rname, vec in fresh.items():
+        np.testing.assert_array_equal(vec, first[rname])
+
+
+def test_result_cache_serves_repeated_queries(encoder, faq_glyphs):
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs, result_cache_size=8)
+    first  = index.search("How do I deploy Glyphh to Heroku?", top_k=3)
+    second = index.search("deploy glyphh heroku", top_k=3)
+    assert second == first
+    assert index.result_cache.stats()["hits"] == 1
+    index.search("deploy glyphh heroku", top_k=5)
+    assert index.result_cache.stats()["misses"] == 2
+
+
+def test_fingerprint_tracks_data_and_options(encoder, faq_glyphs):
+    base    = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    same    = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    fewer   = FAQIndex.from_glyphs(encoder, faq_glyphs[:-1])
+    pruned  = FAQIndex.from_glyphs(encoder, faq_glyphs, prune=True)
+    assert base.fingerprint == same.fingerprint
+    assert base.fingerprint != fewer.fingerprint
+    assert base.fingerprint != pruned.fingerprint
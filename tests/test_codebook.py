@@ -0,0 +1,149 @@
+"""Test the word codebook and the word × entry contribution table."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+import numpy as np
+
+from glyphh.core.types import Concept
+
+from codebook import WordCodebook, WordEntryTable, bow_words, bundle_gain
+from encoder import encode_query, entry_to_record
+from index import ROLE_WEIGHTS, glyph_roles
+
+
+@pytest.fixture(scope="module")
+def codebook(encoder):
+    return WordCodebook(encoder)
+
+
+def test_bow_words_mirror_encoder_filtering():
+    assert bow_words("How do I set-up config.yaml? a") == ["how", "do", "setup", "configyaml"]
+
+
+def test_bag_of_words_matches_encoder(encoder, codebook):
+    for text in ["deploy glyphh heroku", "days day running runs", "", "a b c"]:
+        expected = encoder._encode_bag_of_words(text).data
+        np.testing.assert_array_equal(codebook.bag_of_words(text), expected)
+
+
+def test_query_roles_match_encoder(encoder, codebook, test_queries):
+    for q in test_queries:
+        attrs = encode_query(q["question"])["attributes"]
+        glyph = glyph_roles(encoder.encode(Concept(name="q", attributes=attrs)))
+        fast  = codebook.encode_roles(attrs, ROLE_WEIGHTS)
+        for rname in ROLE_WEIGHTS:
+            np.testing.assert_array_equal(fast[rname], glyph[rname].data)
+
+
+def test_codebook_from_records_covers_vocabulary(encoder):
+    record = entry_to_record({
+        "question": "how do I deploy to Heroku",
+        "answer":   "Push with git.",
+        "keywords": ["dyno", "procfile"],
+    })
+    book = WordCodebook.from_records(encoder, [record])
+    assert {"deploy", "heroku", "push", "git", "dyno", "procfile"} <= set(book.words)
+    size = len(book)
+    book.bag_of_words("completely unseen words")
+    assert len(book) == size + 3
+
+
+def test_index_codebook_search_matches_encoder_search(encoder, faq_glyphs, faq_index, test_queries):
+    from index import FAQIndex
+    fast = FAQIndex.from_glyphs(encoder, faq_glyphs, codebook=True)
+    assert len(fast.codebook) > 100
+    for q in test_queries:
+        assert fast.search(q["question"], top_k=3) == faq_index.search(q["question"], top_k=3)
+
+
+def test_bundle_gain_matches_sampled_bundles():
+    assert bundle_gain(1) == 1.0
+    assert bundle_gain(2) == 0.5
+    rng = np.random.default_rng(0)
+    for m in (3, 4, 7):
+        words  = rng.choice([-1, 1], size=(m, 20000))
+        bundle = np.where(words.sum(axis=0) >= 0, 1, -1)
+        assert abs((bundle @ words[0]) / 20000 - bundle_gain(m)) < 0.02
+
+
+def test_word_table_single_word_rows_are_exact(encoder, faq_index):
+    book  = WordCodebook.from_texts(encoder, ["heroku"])
+    table = WordEntryTable(book, faq_index.matrices, ROLE_WEIGHTS, sigma=0.0)
+    q     = book.role_vector("keywords", "heroku").astype(np.float32)
+    exact = faq_index.matrices["keywords"] @ q / encoder.dimension
+    est   = table.estimate({"keywords": "heroku"}, len(faq_index))
+    np.testing.assert_allclose(est, exact * ROLE_WEIGHTS["keywords"], atol=1e-6)
+
+
+def test_index_word_table_keeps_best_match(encoder, faq_glyphs, faq_index, test_queries):
+    from index import FAQIndex
+    fast = FAQIndex.from_glyphs(encoder, faq_glyphs, word_table=True, table_top_n=16)
+    for q in test_queries:
+        rows = fast.candidates(q["question"])
+        assert rows is not None and len(rows) == 16
+        assert fast.search(q["question"], top_k=1) == faq_index.search(q["question"], top_k=1)
+
+
+def test_default_word_table_agrees_with_dense_top1(encoder, faq_glyphs, faq_index, test_queries):
+    import json
+    from index import FAQIndex
+    with open(Path(__file__).resolve().parent.parent / "benchmark" / "queries.json") as f:
+        benchmark = [q["query"] for q in json.load(f)["queries"]]
+    fast = FAQIndex.from_glyphs(encoder, faq_glyphs, word_table=True)
+    for q in [t["question"] for t in test_queries] + benchmark:
+        _, got  = fast.search(q, top_k=1)[0]
+        _, want = faq_index.search(q, top_k=1)[0]
+        assert got["question_id"] == want["question_id"], q
+
+
+def test_word_table_upserts_match_a_fresh_table(encoder, faq_glyphs):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs[:60], word_table=True)
+    for glyph, meta in faq_glyphs[60:80]:
+        index.upsert_glyph(glyph, meta)
+    glyph, _ = faq_glyphs[5]
+    index.upsert_glyph(glyph, faq_glyphs[0][1])          # row 0 takes new vectors
+    fresh = WordEntryTable(index.codebook, index.matrices, ROLE_WEIGHTS)
+    for rname, rows in fresh.rows.items():
+        assert rows.keys() == index.table.rows[rname].keys()
+        for lemma, (want, vals) in rows.items():
+            got, got_vals = index.table.rows[rname][lemma]
+            order = np.argsort(got)
+            np.testing.assert_array_equal(got[order], want)
+            np.testing.assert_array_equal(got_vals[order], vals)
+
+
+def test_queries_leave_the_codebook_and_table_alone(encoder, faq_glyphs):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs, word_table=True)
+    words, lemmas = len(index.codebook), len(index.table._names)
+    text = "zyzzyva quokka deploy heroku"
+    index.search(text, top_k=3)
+    assert (len(index.codebook), len(index.table._names)) == (words, lemmas)
+    assert "zyzzyva" in index.codebook.query_words
+    lemma, vec = index.codebook.query_vector("zyzzyva")
+    grown = WordEntryTable(index.codebook, index.matrices, ROLE_WEIGHTS)
+    grown._add_rows({lemma: vec})
+    for rname in grown.role_weights:
+        want = grown.rows[rname][lemma]
+        got  = index.table.row(rname, lemma, vec)
+        np.testing.assert_array_equal(got[0], want[0])
+        np.testing.assert_array_equal(got[1], want[1])
+
+
+def test_word_rows_are_chunked_over_entries(encoder, faq_index):
+    book  = WordCodebook.from_texts(encoder, ["deploy heroku billing refund"])
+    table = WordEntryTable(book, faq_index.matrices, ROLE_WEIGHTS, sigma=1.0)
+    words = table._lemmas
+    for rname in table.role_weights:
+        whole = table._word_rows(words, rname, batch=len(faq_index))
+        for (e, v), (we, wv) in zip(table._word_rows(words, rname, batch=7), whole):
+            np.testing.assert_array_equal(e, we)
+            np.testing.assert_array_equal(v, wv)
@@ -1,9 +1,11 @@
 """Test that the encoder config is valid and roles encode correctly."""
 
+import json
 import sys
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+MODEL_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(MODEL_DIR))
 
 from encoder import ENCODER_CONFIG, entry_to_record
 
@@ -142,3 +144,16 @@ def test_test_queries_have_no_answers(test_queries):
     for q in test_queries:
         assert "answer" not in q, "Test data should be raw questions only"
         assert "question" in q
+
+
+def test_entries_to_records_matches_entry_to_record():
+    from encoder import entries_to_records
+    entries = []
+    with open(MODEL_DIR / "data" / "exemplars.jsonl") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                entry = json.loads(line)
+                if i % 2:
+                    entry.pop("category", None)   # half of them need inference
+                entries.append(entry)
+    assert entries_to_records(entries) == [entry_to_record(e) for e in entries]
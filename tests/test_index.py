@@ -0,0 +1,389 @@
+"""Test that the vectorized FAQIndex reproduces per-entry Pattern A scoring."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+from glyphh.core.ops import cosine_similarity
+
+from index import ROLE_WEIGHTS, glyph_roles
+
+
+def _reference_scores(q_roles, faq_glyphs):
+    """Per-entry, per-role cosine loop — the original Pattern A scorer."""
+    scores = []
+    for faq_glyph, _ in faq_glyphs:
+        e_roles = glyph_roles(faq_glyph)
+        weighted_sum = 0.0
+        weight_total = 0.0
+        for rname, w in ROLE_WEIGHTS.items():
+            sim = float(cosine_similarity(
+                q_roles[rname].astype(np.int8), e_roles[rname].data,
+            ))
+            weighted_sum += sim * w
+            weight_total += w
+        scores.append(weighted_sum / weight_total)
+    return np.array(scores)
+
+
+def test_index_stacks_every_role(faq_index, faq_glyphs):
+    assert len(faq_index) == len(faq_glyphs)
+    for rname in ROLE_WEIGHTS:
+        matrix = faq_index.matrices[rname]
+        assert matrix.shape == (len(faq_glyphs), faq_index.dimension)
+        assert matrix.flags["C_CONTIGUOUS"]
+
+
+def test_index_scores_match_reference(faq_index, faq_glyphs, test_queries):
+    for q in test_queries:
+        q_roles = faq_index.encode_query(q["question"])
+        expected = _reference_scores(q_roles, faq_glyphs)
+        np.testing.assert_allclose(faq_index.score(q_roles), expected, atol=1e-12)
+
+
+def test_search_ranks_like_reference(faq_index, faq_glyphs, test_queries):
+    for q in test_queries:
+        q_roles  = faq_index.encode_query(q["question"])
+        expected = _reference_scores(q_roles, faq_glyphs)
+        score, meta = faq_index.search(q["question"])[0]
+        best = faq_glyphs[int(np.argmax(expected))][1]
+        assert meta["question_id"] == best["question_id"]
+        assert score == pytest.approx(expected.max())
+
+
+def test_fused_mode_matches_role_scores(encoder, faq_glyphs, faq_index, test_queries):
+    from index import FAQIndex
+    fused = FAQIndex.from_glyphs(encoder, faq_glyphs, mode="fused")
+    assert fused.fused.shape == (len(faq_glyphs), 4 * fused.dimension)
+    for q in test_queries:
+        q_roles = faq_index.encode_query(q["question"])
+        np.testing.assert_allclose(
+            fused.score(q_roles), faq_index.score(q_roles), atol=1e-5,
+        )
+
+
+def test_pack_bipolar_round_trips(faq_index):
+    from index import pack_bipolar, unpack_bipolar
+    matrix = faq_index.matrices["question"].astype(np.int8)
+    packed = pack_bipolar(matrix)
+    assert packed.dtype == np.uint64
+    assert packed.shape == (len(faq_index), (faq_index.dimension + 63) // 64)
+    np.testing.assert_array_equal(unpack_bipolar(packed, faq_index.dimension), matrix)
+
+
+def test_packed_mode_matches_role_scores(encoder, faq_glyphs, faq_index, test_queries):
+    from index import FAQIndex
+    packed = FAQIndex.from_glyphs(encoder, faq_glyphs, mode="packed")
+    assert not packed.matrices
+    assert packed.nbytes() * 32 <= faq_index.nbytes() * 1.05
+    for q in test_queries:
+        q_roles = faq_index.encode_query(q["question"])
+        np.testing.assert_allclose(
+            packed.score(q_roles), faq_index.score(q_roles), atol=1e-12,
+        )
+
+
+def test_postings_candidates_share_a_token(faq_index):
+    from index import entry_tokens
+    from intent import extract_keywords
+    tokens = extract_keywords("how do I deploy Glyphh to Heroku").split()
+    rows = faq_index.postings.candidates(tokens)
+    assert 0 < len(rows) < len(faq_index)
+    assert faq_index.postings.candidates(["zzzqqq"]).size == 0
+    assert "heroku" in entry_tokens({"question": "deploy to heroku", "keywords": "dyno"})
+
+
+def test_pruned_search_keeps_best_match(encoder, faq_glyphs, faq_index, test_queries):
+    import json
+    from index import FAQIndex
+    with open(Path(__file__).resolve().parent.parent / "benchmark" / "queries.json") as f:
+        benchmark = [q["query"] for q in json.load(f)["queries"]]
+    pruned = FAQIndex.from_glyphs(encoder, faq_glyphs, prune=True)
+    for q in [t["question"] for t in test_queries] + benchmark:
+        full_score, full_meta = faq_index.search(q)[0]
+        score, meta = pruned.search(q)[0]
+        assert meta["question_id"] == full_meta["question_id"], q
+        assert score == pytest.approx(full_score)
+
+
+def test_pruned_search_falls_back_to_full_scan(encoder, faq_glyphs):
+    from index import FAQIndex
+    pruned = FAQIndex.from_glyphs(encoder, faq_glyphs, prune=True)
+    assert pruned.candidates("zzzqqq xyzzy") is None
+    assert len(pruned.search("zzzqqq xyzzy", top_k=len(faq_glyphs))) == len(faq_glyphs)
+    strict = FAQIndex.from_glyphs(encoder, faq_glyphs, prune=True, min_candidates=10_000)
+    assert strict.candidates("how do I deploy Glyphh to Heroku") is None
+
+
+def test_partitions_cover_every_entry(faq_index):
+    rows = np.sort(np.concatenate(list(faq_index.partitions.values())))
+    np.testing.assert_array_equal(rows, np.arange(len(faq_index)))
+    for cat, part in faq_index.partitions.items():
+        assert all(faq_index.metadata[r]["category"] == cat for r in part)
+
+
+def test_routed_search_keeps_category(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    routed = FAQIndex.from_glyphs(encoder, faq_glyphs, route=True, route_threshold=0.35)
+    for q in test_queries:
+        score, meta = routed.search(q["question"])[0]
+        assert meta["category"] == q["_expected_category"], (
+            f"Expected {q['_expected_category']}, got {meta['category']} (score={score:.4f})"
+        )
+
+
+def test_routed_search_expands_below_threshold(encoder, faq_glyphs, faq_index):
+    from index import FAQIndex
+    routed = FAQIndex.from_glyphs(encoder, faq_glyphs, route=True, route_threshold=1.1)
+    query = "how do I deploy Glyphh to Heroku"
+    assert routed.partition_rows(query) is not None
+    assert len(routed.search(query, top_k=len(faq_glyphs))) == len(faq_glyphs)
+    assert routed.search(query)[0][1] is faq_index.search(query)[0][1]
+
+
+def test_route_margin_routes_ties_to_top_two(encoder, faq_glyphs, faq_index):
+    from index import FAQIndex
+    routed = FAQIndex.from_glyphs(encoder, faq_glyphs, route=True, route_margin=1,
+                                  route_threshold=0.0)
+    query = "docker token"
+    both  = np.union1d(routed.partitions["deployment"], routed.partitions["security"])
+    np.testing.assert_array_equal(routed.partition_rows(query), both)
+    assert routed.partition_rows("docker token cli") is None
+    top = routed.search(query, top_k=5)
+    assert {m["category"] for _, m in top} <= {"deployment", "security"}
+    assert top == routed.search_many([query], top_k=5)[0]
+    assert routed.fingerprint != FAQIndex.from_glyphs(
+        encoder, faq_glyphs, route=True, route_threshold=0.0,
+    ).fingerprint
+
+
+def test_select_top_k_matches_full_sort():
+    from index import select_top_k
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.random(500), 2)  # plenty of ties
+    order = np.lexsort((np.arange(500), -scores))
+    for k in (1, 3, 10, 500, 600):
+        np.testing.assert_array_equal(select_top_k(scores, k), order[:k])
+    assert select_top_k(scores, 0).size == 0
+
+
+def test_search_top_k_defaults_to_config(faq_index):
+    from index import load_similarity_config
+    assert faq_index.top_k == load_similarity_config()["top_k"]
+    assert len(faq_index.search("how do I deploy Glyphh to Heroku")) == faq_index.top_k
+    top5 = faq_index.search("how do I deploy Glyphh to Heroku", top_k=5)
+    assert len(top5) == 5
+    assert [s for s, _ in top5] == sorted((s for s, _ in top5), reverse=True)
+
+
+@pytest.mark.parametrize("options", [
+    {"mode": "roles"},
+    {"mode": "fused"},
+    {"mode": "packed"},
+    {"mode": "roles", "prune": True, "route": True, "route_threshold": 0.35},
+])
+def test_search_many_matches_search(encoder, faq_glyphs, test_queries, options):
+    from index import FAQIndex
+    index   = FAQIndex.from_glyphs(encoder, faq_glyphs, **options)
+    queries = [q["question"] for q in test_queries] + ["zzzqqq xyzzy"]
+    batched = index.search_many(queries, top_k=5)
+    assert len(batched) == len(queries)
+    for query, results in zip(queries, batched):
+        single = index.search(query, top_k=5)
+        assert [m["question_id"] for _, m in results] == [m["question_id"] for _, m in single]
+        np.testing.assert_allclose([s for s, _ in results], [s for s, _ in single], atol=1e-6)
+
+
+@pytest.mark.parametrize("mode", ["roles", "packed"])
+def test_bounded_search_matches_full_top_k(encoder, faq_glyphs, faq_index, test_queries, mode):
+    from index import FAQIndex
+    bounded = FAQIndex.from_glyphs(encoder, faq_glyphs, mode=mode, bounded=True)
+    assert "category" in bounded.role_lookup
+    assert "answer" in bounded.role_constant
+    for q in test_queries:
+        for k in (1, 3, 10):
+            full = faq_index.search(q["question"], top_k=k)
+            fast = bounded.search(q["question"], top_k=k)
+            assert [m["question_id"] for _, m in fast] == [m["question_id"] for _, m in full]
+            np.testing.assert_allclose([s for s, _ in fast], [s for s, _ in full], atol=1e-9)
+
+
+def test_bounded_scoring_prunes_entries(encoder, faq_glyphs, faq_index):
+    from index import FAQIndex
+    bounded = FAQIndex.from_glyphs(encoder, faq_glyphs, bounded=True)
+    q_roles = bounded.encode_query("how do I deploy Glyphh to Heroku")
+    scores  = bounded.score_bounded(q_roles, k=1)
+    exact   = faq_index.score(q_roles)
+    assert np.isinf(scores).sum() > len(faq_glyphs) // 2
+    kept = ~np.isinf(scores)
+    np.testing.assert_allclose(scores[kept], exact[kept], atol=1e-9)
+    assert int(np.argmax(scores)) == int(np.argmax(exact))
+
+
+def test_bounded_search_with_top_k_zero(encoder, faq_glyphs):
+    from index import FAQIndex
+    bounded = FAQIndex.from_glyphs(encoder, faq_glyphs, bounded=True)
+    assert bounded.search("how do I deploy Glyphh to Heroku", top_k=0) == []
+    q_roles = bounded.encode_query("how do I deploy Glyphh to Heroku")
+    assert np.all(bounded.score_bounded(q_roles, k=0) == -np.inf)
+
+
+def test_bounded_fused_index_is_rejected(encoder):
+    from index import FAQIndex
+    with pytest.raises(ValueError, match="bounded=True needs per-role scoring"):
+        FAQIndex(encoder, mode="fused", bounded=True)
+
+
+@pytest.mark.parametrize("coarse_path", [("semantic",), ("semantic", "content")])
+def test_hierarchical_search_reranks_coarse_survivors(
+        encoder, faq_glyphs, faq_index, test_queries, coarse_path):
+    from index import FAQIndex
+    hier = FAQIndex.from_glyphs(
+        encoder, faq_glyphs, hierarchical=True, coarse_path=coarse_path, coarse_top_n=40,
+    )
+    assert hier.coarse.shape == (len(faq_glyphs), hier.dimension)
+    for q in test_queries:
+        q_roles = hier.encode_query(q["question"])
+        survivors = hier.coarse_survivors(q_roles)
+        assert len(survivors) == 40
+        score, meta = hier.search(q["question"])[0]
+        assert set(hier.stage_ms) == {"coarse", "fine"}
+        full_score, full_meta = faq_index.search(q["question"])[0]
+        assert meta["question_id"] == full_meta["question_id"]
+        assert score == pytest.approx(full_score)
+
+
+def test_hierarchical_default_keeps_near_threshold_matches(encoder, faq_glyphs, faq_index):
+    from index import FAQIndex
+    hier = FAQIndex.from_glyphs(encoder, faq_glyphs, hierarchical=True, result_cache_size=8)
+    for q in ("pw reset plz", "logging in keeps failing for me"):
+        score, meta = hier.search(q)[0]
+        full_score, full_meta = faq_index.search(q)[0]
+        assert meta["question_id"] == full_meta["question_id"]
+        assert score == pytest.approx(full_score)
+    assert hier.stage_ms["fine"] > 0
+    hier.search("logging in keeps failing for me")            # result-cache hit
+    assert hier.stage_ms == {"coarse": 0.0, "fine": 0.0}
+
+
+def test_hierarchical_search_many_matches_search(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    hier = FAQIndex.from_glyphs(encoder, faq_glyphs, hierarchical=True, coarse_top_n=5)
+    queries = [q["question"] for q in test_queries]
+    assert hier.search_many(queries, top_k=3) == [hier.search(q, top_k=3) for q in queries]
+    hier.search_many(queries)
+    assert set(hier.stage_ms) == {"coarse", "fine"}
+    assert hier.stage_ms["fine"] > 0
+
+
+def _ranking(index, query):
+    return {m["question_id"]: s for s, m in index.search(query, top_k=len(index))}
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"mode": "fused"},
+    {"mode": "packed", "bounded": True},
+    {"prune": True, "route": True},
+    {"ann": True, "word_table": True, "table_top_n": 200},
+])
+def test_upsert_and_delete_match_a_rebuild(encoder, faq_glyphs, test_queries, options):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs[:100], **options)
+    for glyph, meta in faq_glyphs[100:]:
+        index.upsert_glyph(glyph, meta)
+    index.upsert_glyph(*faq_glyphs[0])                  # replace in place
+    for _, meta in faq_glyphs[10:20]:
+        assert index.delete(meta["question_id"])
+    assert not index.delete("no_such_question")
+    assert index.tombstones and len(index) == len(faq_glyphs)
+
+    kept   = faq_glyphs[:10] + faq_glyphs[20:]
+    fresh  = FAQIndex.from_glyphs(encoder, kept, **options)
+    for q in test_queries:
+        got, want = index.search(q["question"], top_k=3), fresh.search(q["question"], top_k=3)
+        assert [m["question_id"] for _, m in got] == [m["question_id"] for _, m in want]
+        assert [s for s, _ in got] == pytest.approx([s for s, _ in want])
+
+    index.compact()
+    assert len(index) == len(kept) and not index.tombstones
+    assert index.row_of == fresh.row_of
+    for q in test_queries:
+        assert _ranking(index, q["question"]) == pytest.approx(_ranking(fresh, q["question"]))
+
+
+@pytest.mark.parametrize("options", [
+    {"hierarchical": True, "coarse_top_n": 10},
+    {"bounded": True},
+    {"ann": True},
+])
+def test_index_built_empty_upserts_like_a_build(encoder, faq_glyphs, test_queries, options):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, [], **options)
+    for glyph, meta in faq_glyphs[:30]:
+        index.upsert_glyph(glyph, meta)
+    fresh = FAQIndex.from_glyphs(encoder, faq_glyphs[:30], **options)
+    if index.hierarchical:
+        assert index.coarse.shape == fresh.coarse.shape
+    if index.use_ann:
+        # Hashed with the bucket width of a one-row corpus, so only check it is used.
+        assert index.ann is not None
+        assert len(index.candidates(test_queries[0]["question"])) <= len(index)
+        return
+    for q in test_queries:
+        assert _ranking(index, q["question"]) == pytest.approx(_ranking(fresh, q["question"]))
+
+
+def test_upsert_grows_into_spare_capacity(encoder, faq_glyphs):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs[:20])
+    index.upsert_glyph(*faq_glyphs[20])
+    base = index.matrices["question"].base
+    index.upsert_glyph(*faq_glyphs[21])
+    assert index.matrices["question"].base is base
+    tokens = index.postings.row_tokens[21]
+    assert tokens and all(21 in index.postings.postings[t] for t in tokens)
+
+
+def test_edits_update_partitions_incrementally(encoder, faq_glyphs):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs[:60], route=True, bounded=True)
+    for glyph, meta in faq_glyphs[60:80]:
+        index.upsert_glyph(glyph, meta)
+    glyph, meta = faq_glyphs[0]
+    other = next(m["category"] for _, m in faq_glyphs if m["category"] != meta["category"])
+    index.upsert_glyph(glyph, dict(meta, category=other))   # moves partitions
+    for _, meta in faq_glyphs[30:35]:
+        index.delete(meta["question_id"])
+    # Deleted rows stay in their partition until compact(); partitions_of() skips them.
+    partitions = {cat: index.partitions_of((cat,)) for cat in index.partitions}
+    partitions = {cat: rows for cat, rows in partitions.items() if rows is not None}
+    live     = index.live_rows()
+    constant = {r: cos.copy() for r, (_, cos) in index.role_constant.items()}
+    index._refresh()
+    assert np.array_equal(live, index.live_rows())
+    assert partitions.keys() == index.partitions.keys()
+    for cat, rows in partitions.items():
+        assert np.array_equal(rows, index.partitions[cat])
+    index._build_derived()
+    for rname, cos in constant.items():
+        np.testing.assert_allclose(cos, index.role_constant[rname][1])
+
+
+def test_delete_compacts_past_ratio(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs[:40], result_cache_size=64)
+    fingerprint = index.fingerprint
+    index.search(test_queries[0]["question"])
+    for _, meta in faq_glyphs[:10]:
+        index.delete(meta["question_id"])
+    assert index.fingerprint != fingerprint and len(index.result_cache) == 0
+    assert len(index) == 40 and len(index.tombstones) == 10
+    index.delete(faq_glyphs[10][1]["question_id"])
+    assert len(index) == 29 and not index.tombstones
@@ -0,0 +1,49 @@
+"""Test the LRU caches and canonical query keys (no SDK needed)."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import LRUCache, ResultCache, query_key
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1          # "b" is now least recent
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+    assert stats["size"] == 2
+
+
+def test_lru_with_zero_size_stores_nothing():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert len(cache) == 0
+
+
+def test_query_key_ignores_order_case_punctuation_and_stopwords():
+    a = query_key("How do I deploy Glyphh to Heroku?")
+    b = query_key("heroku: deploy glyphh")
+    c = query_key("deploy glyphh heroku heroku")
+    assert a == b == c
+    assert query_key("how do I deploy glyphh") != a
+
+
+def test_query_key_keeps_stopword_only_queries_apart():
+    assert query_key("how do I") != query_key("what is it")
+
+
+def test_result_cache_drops_entries_on_new_fingerprint():
+    cache = ResultCache(maxsize=4)
+    cache.bind("v1")
+    cache.put("q", ["result"])
+    cache.bind("v1")
+    assert cache.get("q") == ["result"]
+    cache.bind("v2")
+    assert cache.get("q") is None
@@ -102,3 +102,106 @@ def test_keywords_exclude_common_stop_words():
     assert any(w in kw for w in ("deploy", "glyphh", "production", "docker")), (
         f"Expected meaningful keywords in: {kw}"
     )
+
+
+def _regex_signal_counts(lower):
+    """The per-signal regex scan the signal trie replaces."""
+    import re
+    from intent import _CATEGORY_SIGNALS
+    return {
+        cat: sum(1 for s in signals if re.search(r"\b" + re.escape(s) + r"\b", lower))
+        for cat, signals in _CATEGORY_SIGNALS.items()
+    }
+
+
+def test_signal_trie_matches_regex_scan(test_queries):
+    import json
+    from intent import _category_signal_counts
+
+    texts = [q["question"] for q in test_queries]
+    with open(Path(__file__).resolve().parent.parent / "data" / "exemplars.jsonl") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                texts += [entry["question"], entry["answer"]]
+    texts += [
+        "", "glyphh", "my.glyphh file", "a .glyphh file", "get  started",
+        "docker compose up", "no match: no_match", "bag_of_words_x", "500 errors",
+        "encoder.py/config.yaml", "hdc vs rag", "İnstall",
+    ]
+    for text in texts:
+        lower = text.lower()
+        assert _category_signal_counts(lower) == _regex_signal_counts(lower), text
+
+
+def test_analysis_matches_separate_passes(test_queries):
+    from intent import (
+        _preprocess, analyze, extract_keywords, has_category_signal, infer_category,
+    )
+
+    for q in [t["question"] for t in test_queries] + ["", "...", "Config.YAML & encoder.py?"]:
+        analysis = analyze(q)
+        cleaned  = _preprocess(q)
+        assert analysis.cleaned == cleaned
+        assert analysis.tokens == tuple(cleaned.split())
+        assert analysis.keyword_text == extract_keywords(q)
+        assert analysis.category == infer_category(cleaned)
+        assert analysis.has_signal == has_category_signal(cleaned)
+        assert analyze(q, raw_signals=True).category == infer_category(q)
+        assert analyze(analysis) is analysis
+        assert encode_query(analysis) == encode_query(q)
+
+
+def test_category_distribution_and_routing_decision():
+    from intent import (
+        category_margin, category_scores, infer_category, rank_categories, route_categories,
+    )
+
+    counts = category_scores("docker token")
+    assert set(counts) >= {"deployment", "security", "general"}
+    assert rank_categories(counts) == [("deployment", 1), ("security", 1)]
+    assert rank_categories(counts)[0][0] == infer_category("docker token")
+    assert category_margin(counts) == 0
+    assert route_categories(counts) == ("deployment",)
+    assert route_categories(counts, margin=1) == ("deployment", "security")
+    assert route_categories(category_scores("docker token cli"), margin=1) == ()
+
+    counts = category_scores("deploy docker heroku token")
+    assert category_margin(counts) == 2
+    assert route_categories(counts, margin=2) == ("deployment",)
+    assert route_categories(category_scores("hello there"), margin=1) == ()
+    assert category_margin(category_scores("hello there")) == 0
+
+
+def test_batch_category_and_keywords_match_single_calls(monkeypatch):
+    import intent
+    texts = [
+        "how do I install Glyphh", "docker token", "how do I install Glyphh",
+        "What Is An EncoderConfig?", "", "config.yaml for my custom model",
+    ]
+    want_cats = [intent.infer_category(t) for t in texts]
+    want_kws  = [intent.extract_keywords(t) for t in texts]
+    assert intent.infer_categories(texts) == want_cats
+    assert intent.extract_keywords_many(texts) == want_kws
+
+    monkeypatch.setattr(intent, "POOL_MIN_TEXTS", 1)
+    assert intent.infer_categories(texts, processes=2) == want_cats
+    assert intent.extract_keywords_many(texts, processes=2) == want_kws
+
+
+def test_signals_split_into_words_and_phrases():
+    from intent import _CATEGORY_SIGNALS, _PHRASE_TRIE, _SIGNAL_WORDS
+
+    def phrases(node, prefix=""):
+        for key, child in node.items():
+            if key == "":
+                yield prefix, len(child)
+            else:
+                yield from phrases(child, prefix + key)
+
+    listed = sum(len(signals) for signals in _CATEGORY_SIGNALS.values())
+    found  = dict(phrases(_PHRASE_TRIE))
+    assert sum(len(c) for c in _SIGNAL_WORDS.values()) + sum(found.values()) == listed
+    assert "docker" in _SIGNAL_WORDS and "docker" not in found
+    assert "docker compose" in found and "config.yaml" in found
+    assert all(" " in p or not p.isalnum() for p in found)
@@ -0,0 +1,127 @@
+"""Test that scatter-gather over shards returns the unsharded index's top-k."""
+
+import sys
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+from index import FAQIndex
+from shard import ReplicaPool, ShardedIndex, assign_shards, build_shards
+from store import write_index
+
+
+@pytest.fixture(scope="module", params=["hash", "category"])
+def manifest(request, tmp_path_factory, encoder, faq_glyphs):
+    directory = tmp_path_factory.mktemp(f"shards-{request.param}")
+    return build_shards(encoder, faq_glyphs, directory, 3, by=request.param)
+
+
+def test_assign_shards_partitions_every_row(faq_glyphs):
+    metadata = [m for _, m in faq_glyphs]
+    for by in ("hash", "category"):
+        shards = assign_shards(metadata, 3, by)
+        rows   = np.sort(np.concatenate(shards))
+        assert np.array_equal(rows, np.arange(len(metadata)))
+    shard_of = {
+        metadata[r]["category"]: s
+        for s, rows in enumerate(assign_shards(metadata, 3, "category")) for r in rows
+    }
+    for s, rows in enumerate(assign_shards(metadata, 3, "category")):
+        assert all(shard_of[metadata[r]["category"]] == s for r in rows)
+    with pytest.raises(ValueError, match="Unknown shard key"):
+        assign_shards(metadata, 3, "length")
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"prune": True},
+    {"route": True},
+    {"prune": True, "route": True, "min_candidates": 5},
+])
+def test_in_process_shards_match_unsharded(encoder, faq_glyphs, manifest, test_queries, options):
+    single  = FAQIndex.from_glyphs(encoder, faq_glyphs, **options)
+    route   = options.pop("route", False)
+    sharded = ShardedIndex(encoder, manifest, processes=False, route=route,
+                           route_threshold=single.route_threshold, **options)
+    assert len(sharded) == len(single)
+    queries = [q["question"] for q in test_queries]
+    for q in queries:
+        assert sharded.search(q, top_k=3) == single.search(q, top_k=3)
+    assert sharded.search_many(queries, top_k=3) == [single.search(q, top_k=3) for q in queries]
+
+
+def test_sharded_defaults_follow_faq_index(encoder, faq_glyphs, manifest, test_queries):
+    single  = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    sharded = ShardedIndex(encoder, manifest, processes=False)
+    assert (sharded.top_k, sharded.route_threshold) == (single.top_k, single.route_threshold)
+    query = test_queries[0]["question"]
+    assert sharded.search(query) == single.search(query)
+
+
+def test_hierarchical_shards_store_coarse_vectors(encoder, faq_glyphs, test_queries, tmp_path):
+    manifest = build_shards(encoder, faq_glyphs, tmp_path, 3, hierarchical=True)
+    sharded  = ShardedIndex(encoder, manifest, processes=False,
+                            hierarchical=True, coarse_top_n=40)
+    assert all(shard.index.coarse is not None for shard in sharded._local)
+    single = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    for q in test_queries:
+        assert sharded.search(q["question"]) == single.search(q["question"])
+
+
+def test_hierarchical_shards_fall_back_at_the_sharded_threshold(
+        encoder, faq_glyphs, test_queries, tmp_path):
+    manifest = build_shards(encoder, faq_glyphs, tmp_path, 3, hierarchical=True)
+    sharded  = ShardedIndex(encoder, manifest, processes=False, route_threshold=0.9,
+                            hierarchical=True, coarse_top_n=5)
+    assert all(shard.index.route_threshold == 0.9 for shard in sharded._local)
+    single = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    for q in test_queries:
+        assert sharded.search(q["question"], top_k=3) == single.search(q["question"], top_k=3)
+
+
+def test_worker_processes_match_unsharded(encoder, faq_glyphs, manifest, test_queries):
+    single  = FAQIndex.from_glyphs(encoder, faq_glyphs, prune=True)
+    queries = [q["question"] for q in test_queries]
+    with ShardedIndex(encoder, manifest, prune=True) as sharded:
+        assert sharded.search_many(queries, top_k=3) == [single.search(q, top_k=3) for q in queries]
+        assert sharded.search(queries[0]) == single.search(queries[0], top_k=sharded.top_k)
+
+
+def test_replica_pool_workers_share_one_copy(encoder, faq_glyphs, test_queries, tmp_path):
+    single = FAQIndex.from_glyphs(encoder, faq_glyphs, codebook=True, route=True)
+    path   = write_index(single, tmp_path / "faq.index")
+    queries = [q["question"] for q in test_queries]
+    with ReplicaPool(encoder, path, workers=2, route=True) as pool:
+        assert len(pool) == len(single)
+        assert pool.search_many(queries, top_k=3) == single.search_many(queries, top_k=3)
+        for q in queries[:3]:
+            assert pool.search(q, top_k=3) == single.search(q, top_k=3)
+        name = pool.block.name
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_benchmark_aggregate_without_stage_timings():
+    from benchmark.run import _aggregate
+    row = {"correct": True, "category_correct": True, "expected_id": "q1",
+           "query_category": "clear", "latency_ms": 1.0, "stage_ms": None}
+    staged = {**row, "stage_ms": {"coarse": 0.5, "fine": 1.5}}
+    sharded = {**row, "stage_ms": {"scatter": 2.0}}
+    assert _aggregate([row, sharded])["stage_mean_ms"] == {}
+    assert _aggregate([row, staged])["stage_mean_ms"] == {"coarse": 0.5, "fine": 1.5}
+
+
+def test_benchmark_matcher_rejects_edits_on_shards(encoder, manifest):
+    from benchmark.run import FAQMatcher
+    matcher = FAQMatcher.__new__(FAQMatcher)
+    matcher.index = ShardedIndex(encoder, manifest, processes=False)
+    with pytest.raises(TypeError, match="ShardedIndex serves read-only"):
+        matcher.delete("gs_install")
+    with pytest.raises(TypeError, match="without --shards or --replicas"):
+        matcher.upsert({"question_id": "gs_install"})
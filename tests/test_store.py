@@ -0,0 +1,184 @@
+"""Test that a memory-mapped index file reproduces the in-memory index."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+from index import FAQIndex
+from store import (
+    CorruptSnapshot, LazyRecords, SnapshotMismatch, attach_index, check_snapshot, data_digest,
+    load_or_build, open_index, read_header, share_index, write_index,
+)
+
+
+@pytest.fixture(scope="module")
+def index_file(tmp_path_factory, encoder, faq_glyphs):
+    built = FAQIndex.from_glyphs(encoder, faq_glyphs, codebook=True)
+    return write_index(built, tmp_path_factory.mktemp("store") / "faq.index")
+
+
+@pytest.mark.parametrize("mode,options", [
+    ("roles", {}),
+    ("fused", {}),
+    ("packed", {"bounded": True}),
+    ("roles", {"prune": True, "route": True}),
+    ("roles", {"codebook": True, "word_table": True}),
+])
+def test_opened_index_matches_built_index(encoder, faq_glyphs, index_file, test_queries,
+                                          mode, options):
+    built  = FAQIndex.from_glyphs(encoder, faq_glyphs, mode=mode, **options)
+    opened = open_index(encoder, index_file, mode, **options)
+    assert len(opened) == len(built)
+    assert opened.fingerprint == built.fingerprint
+    for q in test_queries:
+        assert opened.search(q["question"], top_k=3) == built.search(q["question"], top_k=3)
+
+
+def test_arrays_are_read_only_views_of_the_file(encoder, index_file):
+    opened = open_index(encoder, index_file)
+    matrix = opened.matrices["question"]
+    assert not matrix.flags.writeable and not matrix.flags.owndata
+    assert isinstance(opened.metadata, LazyRecords)
+    header = read_header(opened._mmap)
+    assert header["arrays"]["matrices/question"]["offset"] % 64 == 0
+
+
+def test_opened_codebook_needs_no_morphology(encoder, faq_index, index_file):
+    opened = open_index(encoder, index_file, codebook=True)
+    assert len(opened.codebook) > 100
+    word, (lemma, vec) = next(iter(opened.codebook.words.items()))
+    assert vec.dtype == np.int16
+    assert opened.codebook.word_vector(word)[0] == lemma
+
+
+def test_opened_index_accepts_upserts(encoder, faq_glyphs, index_file, test_queries):
+    opened = open_index(encoder, index_file, prune=True)
+    glyph, meta = faq_glyphs[0]
+    assert opened.upsert_glyph(glyph, meta) == 0
+    assert opened.delete(faq_glyphs[1][1]["question_id"])
+    assert faq_glyphs[1][1]["question_id"] not in opened.row_of
+    kept  = faq_glyphs[:1] + faq_glyphs[2:]
+    fresh = FAQIndex.from_glyphs(encoder, kept, prune=True)
+    for q in test_queries:
+        got, want = opened.search(q["question"], top_k=3), fresh.search(q["question"], top_k=3)
+        assert [m["question_id"] for _, m in got] == [m["question_id"] for _, m in want]
+
+
+def test_written_digest_covers_only_live_rows(encoder, faq_glyphs, tmp_path):
+    from index import digest_entries
+    edited = FAQIndex.from_glyphs(encoder, faq_glyphs[:40])
+    for _, meta in faq_glyphs[5:10]:
+        edited.delete(meta["question_id"])
+    assert edited.tombstones
+    opened = open_index(encoder, write_index(edited, tmp_path / "faq.index"))
+    fresh  = FAQIndex.from_glyphs(encoder, faq_glyphs[:5] + faq_glyphs[10:40])
+    assert opened.corpus_digest() == digest_entries(opened.entry_digests)
+    assert opened.fingerprint == fresh.fingerprint
+
+
+def test_config_mismatch_is_rejected(encoder, index_file, tmp_path):
+    header = read_header(index_file.read_bytes())
+    assert header["n_entries"] > 0
+    raw  = index_file.read_bytes()
+    stale = tmp_path / "stale.index"
+    stale.write_bytes(raw.replace(header["config_fingerprint"].encode(), b"0" * 64, 1))
+    with pytest.raises(SnapshotMismatch, match="encoder config changed"):
+        open_index(encoder, stale)
+    with pytest.raises(ValueError, match="bad magic"):
+        (tmp_path / "junk.index").write_bytes(b"x" * 64)
+        open_index(encoder, tmp_path / "junk.index")
+
+
+def test_snapshot_checks_rules_weights_and_data(encoder, index_file, monkeypatch):
+    import intent
+    header = read_header(index_file.read_bytes())
+    assert check_snapshot(header, encoder) == []
+    assert check_snapshot(header, encoder, data="other") == ["source data changed"]
+    weights = {"question": 1.0, "category": 0.5, "keywords": 0.8, "answer": 0.4}
+    assert check_snapshot(header, encoder, weights) == ["role weights changed"]
+    monkeypatch.setattr(intent, "PREPROCESS_VERSION", intent.PREPROCESS_VERSION + 1)
+    assert check_snapshot(header, encoder) == ["preprocessing rules changed"]
+    with pytest.raises(SnapshotMismatch, match="preprocessing rules changed"):
+        open_index(encoder, index_file)
+
+
+def test_load_or_build_rebuilds_stale_snapshots(encoder, tmp_path):
+    from encoder import entry_to_record
+    entries = [
+        {"question_id": "deploy", "category": "deployment", "question": "how do I deploy",
+         "answer": "Push it.", "keywords": ["deploy", "push"]},
+        {"question_id": "refund", "category": "billing", "question": "can I get a refund",
+         "answer": "Yes.", "keywords": ["refund", "money"]},
+    ]
+    path    = tmp_path / "faq.index"
+    calls   = []
+
+    def records():
+        calls.append(1)
+        return [entry_to_record(e) for e in entries]
+
+    first = load_or_build(encoder, path, records, data=data_digest(entries))
+    assert len(calls) == 1 and len(first) == 2
+    again = load_or_build(encoder, path, records, data=data_digest(entries))
+    assert len(calls) == 1 and again.fingerprint == first.fingerprint
+
+    entries[1]["answer"] = "No."
+    with pytest.raises(SnapshotMismatch, match="source data changed"):
+        load_or_build(encoder, path, records, data=data_digest(entries), rebuild=False)
+    fresh = load_or_build(encoder, path, records, data=data_digest(entries))
+    assert len(calls) == 2
+    assert fresh.search("refund please", top_k=1)[0][1]["answer"] == "No."
+
+
+def test_load_or_build_rebuilds_truncated_snapshots(encoder, index_file, tmp_path):
+    from encoder import entry_to_record
+    entries = [
+        {"question_id": "deploy", "category": "deployment", "question": "how do I deploy",
+         "answer": "Push it.", "keywords": ["deploy", "push"]},
+    ]
+    raw  = index_file.read_bytes()
+    path = tmp_path / "faq.index"
+    for cut in (len(raw) // 2, 40, 12, 0):
+        path.write_bytes(raw[:cut])
+        with pytest.raises(CorruptSnapshot):
+            open_index(encoder, path)
+        rebuilt = load_or_build(encoder, path, lambda: [entry_to_record(e) for e in entries])
+        assert len(rebuilt) == 1
+
+
+def test_hierarchical_snapshot_is_rebuilt_with_coarse_vectors(encoder, tmp_path):
+    from encoder import entry_to_record
+    entries = [
+        {"question_id": "deploy", "category": "deployment", "question": "how do I deploy",
+         "answer": "Push it.", "keywords": ["deploy", "push"]},
+        {"question_id": "refund", "category": "billing", "question": "can I get a refund",
+         "answer": "Yes.", "keywords": ["refund", "money"]},
+    ]
+    path = tmp_path / "faq.index"
+    load_or_build(encoder, path, lambda: [entry_to_record(e) for e in entries])
+    with pytest.raises(SnapshotMismatch, match="no coarse vectors"):
+        open_index(encoder, path, hierarchical=True)
+    opened = load_or_build(encoder, path, lambda: [entry_to_record(e) for e in entries],
+                           hierarchical=True)
+    assert opened.coarse is not None and opened.coarse.shape[0] == 2
+    assert opened.search("refund please", top_k=1)[0][1]["question_id"] == "refund"
+
+
+def test_attached_index_views_shared_memory(encoder, faq_glyphs, index_file, test_queries):
+    block = share_index(index_file)
+    try:
+        attached = attach_index(encoder, block.name, route=True)
+        built    = FAQIndex.from_glyphs(encoder, faq_glyphs, route=True)
+        matrix   = attached.matrices["question"]
+        assert not matrix.flags.writeable and not matrix.flags.owndata
+        for q in test_queries:
+            assert attached.search(q["question"], top_k=3) == built.search(q["question"], top_k=3)
+    finally:
+        block.close()
+        block.unlink()
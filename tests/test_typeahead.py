@@ -0,0 +1,132 @@
+"""Test that incremental typeahead scoring matches a full search per keystroke."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+glyphh = pytest.importorskip("glyphh")
+
+import numpy as np
+
+from typeahead import TypeaheadSession, committed_prefix, typeahead_report
+
+
+def test_every_prefix_matches_search(faq_index, test_queries):
+    session = TypeaheadSession(faq_index)
+    for q in test_queries[:6]:
+        text = q["question"]
+        for end in range(1, len(text) + 1):
+            want = faq_index.search(committed_prefix(text[:end]), top_k=3)
+            assert session.type(text[:end], 3) == want
+        assert session.type(text, 3, complete=True) == faq_index.search(text, top_k=3)
+
+
+def test_partial_word_is_not_scored(faq_index):
+    assert committed_prefix("how do I depl") == "how do I "
+    assert committed_prefix("config.") == "config."
+    session = TypeaheadSession(faq_index)
+    session.type("deploy her", 3)
+    assert session.words == ["deploy"]
+    session.type("deploy heroku?", 3)
+    assert session.words == ["deploy", "heroku"]
+
+
+def test_scores_are_exact_after_edits(faq_index):
+    session = TypeaheadSession(faq_index)
+    for text in ["how do I deploy", "how do I deploy to heroku", "deploy heroku heroku",
+                 "how do I", "", "the and of", "billing refund"]:
+        session.update(text, complete=True)
+        np.testing.assert_array_equal(
+            session.scores(), faq_index.score(faq_index.encode_query(text)),
+        )
+
+
+def test_add_and_remove_tokens(faq_index):
+    session = TypeaheadSession(faq_index)
+    empty = session.scores()
+    session.add_token("deploy")
+    session.add_token("heroku")
+    np.testing.assert_array_equal(
+        session.scores(), faq_index.score(faq_index.encode_query("deploy heroku")),
+    )
+    session.remove_token("heroku")
+    session.remove_token("deploy")
+    np.testing.assert_array_equal(session.scores(), empty)
+
+
+def test_routed_session_matches_routed_search(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    routed  = FAQIndex.from_glyphs(encoder, faq_glyphs, route=True)
+    session = TypeaheadSession(routed)
+    for q in test_queries:
+        assert session.type(q["question"], 3, complete=True) == routed.search(q["question"], top_k=3)
+
+
+def test_session_leaves_the_index_codebook_alone(encoder, faq_glyphs):
+    from index import FAQIndex
+    index   = FAQIndex.from_glyphs(encoder, faq_glyphs)
+    session = TypeaheadSession(index, word_cache_size=4)
+    text = "how do I deploy glyphh to heroku"
+    for end in range(1, len(text) + 1):
+        session.type(text[:end], 3, complete=True)
+    assert index.codebook is None
+    assert len(session.word_cache) == 4
+    assert session.results(3) == index.search(text, top_k=3)
+
+
+def test_session_follows_index_edits(encoder, faq_glyphs, test_queries):
+    from index import FAQIndex
+    index   = FAQIndex.from_glyphs(encoder, faq_glyphs[:20])
+    session = TypeaheadSession(index)
+    text    = test_queries[0]["question"]
+    session.type(text, 3, complete=True)
+    for glyph, meta in faq_glyphs[20:]:
+        index.upsert_glyph(glyph, meta)
+    assert session.results(3) == index.search(text, top_k=3)
+    index.delete(faq_glyphs[0][1]["question_id"])
+    assert session.type(text + " now ", 3) == index.search(text + " now", top_k=3)
+
+
+def test_sessions_share_one_column_copy(encoder, faq_glyphs):
+    from index import FAQIndex
+    index = FAQIndex.from_glyphs(encoder, faq_glyphs[:20])
+    first, second = TypeaheadSession(index), TypeaheadSession(index)
+    first.type("deploy heroku ", 3)
+    second.type("billing refund ", 3)
+    columns = index.role_columns("question")
+    assert not columns.flags.writeable
+    assert index.role_columns("question") is columns
+    index.upsert_glyph(*faq_glyphs[20])
+    assert first.type("deploy heroku ", 3) == index.search("deploy heroku", top_k=3)
+    assert index.role_columns("question") is not columns
+    assert index.role_columns("question").shape == (index.dimension, 21)
+
+
+def test_typeahead_report(faq_index, test_queries):
+    report = typeahead_report(faq_index, [q["question"] for q in test_queries[:2]])
+    assert report["keystrokes"] == sum(len(q["question"]) for q in test_queries[:2])
+    assert report["agreement"] == 1.0
+
+
+def test_keystrokes_inside_a_word_do_no_work(faq_index, test_queries, monkeypatch):
+    session = TypeaheadSession(faq_index)
+    calls   = {"encode_word": 0, "scores": 0}
+    def counted(name, fn):
+        def wrapper(*args):
+            calls[name] += 1
+            return fn(*args)
+        return wrapper
+    monkeypatch.setattr(session.codebook, "encode_word",
+                        counted("encode_word", session.codebook.encode_word))
+    monkeypatch.setattr(session, "scores", counted("scores", session.scores))
+    text = test_queries[0]["question"]
+    for end in range(1, len(text) + 1):
+        session.type(text[:end], 3, complete=end == len(text))
+    # One encoding per distinct word and one scoring pass per committed
+    # word, against one of each per keystroke for search() on every prefix.
+    words = text.split()
+    assert calls["encode_word"] <= len(set(words)) < len(text)
+    assert calls["scores"] <= len(words) + 1 < len(text)
@@ -0,0 +1,330 @@
+"""
+Keystroke-incremental query scoring for search-as-you-type.
+
+Exports:
+  committed_prefix(text) — `text` without its trailing partial word
+  TypeaheadSession — per-session query state over a FAQIndex, updated one
+                     token at a time instead of re-encoding and re-scoring
+  typeahead_report(index, queries) — per-keystroke latency of a session vs
+                                     a full search() on every prefix
+
+A query's question and keywords roles are role ⊙ sign(Σ lemma vectors). The
+session keeps that int16 sum for each bag-of-words role together with every
+entry's dot product against the current role vector. Adding or removing a
+token changes the sum by one word vector; only the dimensions whose sign
+flipped change the query vector, so each entry's dot product is updated
+from those columns alone. The updates are integer-exact, so the scores are
+identical to FAQIndex.score() on the full text.
+
+The category role only takes a handful of distinct values and the answer
+role is constant for queries, so their per-entry cosines are cached by value.
+Routing (route=True) is applied as in FAQIndex.search_many(); token pruning
+and ANN candidates are not — a typeahead session always ranks every live
+entry. Sessions keep only their per-entry dot products; the transposed role
+matrices are one read-only copy on the index (FAQIndex.role_columns()).
+After FAQIndex.upsert() or delete() changes the index's length or
+fingerprint, a session's next call resets its dots and replays its words.
+
+A word still being typed is not scored: update() and type() apply only the
+committed_prefix() of the input, so a keystroke inside a word changes
+nothing and returns the previous results. Encoding every partial word
+through the morphology engine would otherwise cost more per keystroke than
+a full search(). complete=True (e.g. on submit) applies the last word too.
+When several bag-of-words roles end up with the same lemma set, its sum
+and sign are computed once and shared.
+
+Word vectors come from the index's codebook when it has one, read-only.
+Words it lacks are encoded into a bounded per-session LRUCache rather than
+growing the shared codebook.
+"""
+
+import re
+import time
+from collections import Counter
+from typing import Any
+
+import numpy as np
+
+from cache import LRUCache
+from codebook import WordCodebook, bow_words
+from index import QUERY_CONSTANT_ROLES
+from intent import (
+    _STOPWORDS, _best_category, _category_signal_counts, analyze, route_categories,
+)
+
+
+_PARTIAL_WORD = re.compile(r"\w+$")
+
+
+def committed_prefix(text: str) -> str:
+    """`text` up to its last separator: the part a TypeaheadSession scores."""
+    return _PARTIAL_WORD.sub("", text)
+
+
+def _is_keyword(word: str) -> bool:
+    """extract_keywords() filter for one cleaned word."""
+    return word not in _STOPWORDS and len(word) > 1
+
+
+class TypeaheadSession:
+    """Incrementally maintained query vectors and per-entry scores for one input box."""
+
+    def __init__(self, index, word_cache_size: int = 1024):
+        self.index = index
+        # Read-only: out-of-vocabulary words go to word_cache (see _word_vector()).
+        self.codebook = index.codebook
+        if self.codebook is None:
+            self.codebook = WordCodebook(index.encoder)
+        self.word_cache = LRUCache(word_cache_size)
+        self.dimension = index.dimension
+        self.bow_roles = [
+            r for r in self.codebook.bow_roles()
+            if r in index.role_weights and r not in QUERY_CONSTANT_ROLES
+        ]
+        self._role_syms = {
+            rname: self.codebook._symbol(rname).astype(np.int16) for rname in self.bow_roles
+        }
+        self._empty = self.codebook._symbol("__empty__").astype(np.int16)
+        self._lemma_vecs: dict[str, np.ndarray] = {}
+        self._category: tuple[str, dict[str, int]] = ("", {})
+        self.reset()
+
+    def _sync(self) -> None:
+        """Reset and replay the current words if the index changed since reset()."""
+        if (len(self.index), self.index.fingerprint) == self._state:
+            return
+        words, text = self.words, self.text
+        self.reset()
+        for word in words:
+            self.words.append(word)
+            self._count(word, +1)
+        self._refresh_roles()
+        self.text = text
+
+    def reset(self) -> None:
+        """Clear the input box."""
+        self._state = (len(self.index), self.index.fingerprint)
+        self._value_cos: dict[tuple[str, str], np.ndarray] = {}
+        self.words: list[str] = []
+        self.text = ""
+        self._n_keywords = 0
+        self._keyword_lemmas: Counter = Counter()
+        self._all_lemmas: Counter = Counter()
+        self._last: tuple[tuple, list] | None = None
+        self._role_lemmas = {r: frozenset() for r in self.bow_roles}
+        self._sums   = {r: np.zeros(self.dimension, dtype=np.int16) for r in self.bow_roles}
+        self._values = {r: self._empty for r in self.bow_roles}
+        self._dots   = {
+            rname: (
+                (self._role_syms[rname] * self._empty).astype(np.float32)
+                @ self.index.role_columns(rname)
+            ).astype(np.float64)
+            for rname in self.bow_roles
+        }
+
+    # -- Token updates --------------------------------------------------------
+
+    def add_token(self, word: str) -> None:
+        """Append one cleaned word to the query."""
+        self._sync()
+        self.words.append(word)
+        self.text = " ".join(self.words)
+        self._count(word, +1)
+        self._refresh_roles()
+
+    def remove_token(self, word: str) -> None:
+        """Remove one occurrence of a word added earlier."""
+        self._sync()
+        self.words.remove(word)
+        self.text = " ".join(self.words)
+        self._count(word, -1)
+        self._refresh_roles()
+
+    def update(self, text: str, complete: bool = False) -> None:
+        """Move to the input `text`, applying only the words that changed.
+
+        The trailing partial word is left out unless complete=True.
+        """
+        self._sync()
+        analysis = analyze(text if complete else committed_prefix(text))
+        words    = list(analysis.tokens)
+        before, after = Counter(self.words), Counter(words)
+        if before == after:
+            self.words, self.text = words, analysis.cleaned
+            return
+        for word in (before - after).elements():
+            self._count(word, -1)
+        for word in (after - before).elements():
+            self._count(word, +1)
+        self._refresh_roles()
+        self.words = words
+        self.text  = analysis.cleaned
+
+    def _count(self, word: str, delta: int) -> None:
+        lemma = None
+        for bow in bow_words(word):
+            lemma, vec = self._word_vector(bow)
+            self._lemma_vecs[lemma] = vec
+        if lemma is not None:
+            self._all_lemmas[lemma] += delta
+        if _is_keyword(word):
+            self._n_keywords += delta
+            if lemma is not None:
+                self._keyword_lemmas[lemma] += delta
+
+    def _refresh_roles(self) -> None:
+        """Move every BoW role to the lemma set of the current words."""
+        self._keyword_lemmas += Counter()   # drop zero counts
+        self._all_lemmas     += Counter()
+        # encode_query(): keywords role = keyword words; question role =
+        # keyword words, or every cleaned word when there are none.
+        keyword_lemmas, all_lemmas = frozenset(self._keyword_lemmas), frozenset(self._all_lemmas)
+        settled: dict[frozenset, str] = {}
+        for rname in self.bow_roles:
+            if rname == "keywords" or self._n_keywords:
+                self._set_lemmas(rname, keyword_lemmas, settled)
+            else:
+                self._set_lemmas(rname, all_lemmas, settled)
+        for lemma in self._lemma_vecs.keys() - self._all_lemmas.keys():
+            del self._lemma_vecs[lemma]
+
+    def _word_vector(self, word: str) -> tuple[str, np.ndarray]:
+        """codebook.word_vector() without growing a shared codebook."""
+        entry = self.codebook.words.get(word)
+        if entry is None:
+            entry = self.word_cache.get(word)
+            if entry is None:
+                entry = self.codebook.encode_word(word)
+                self.word_cache.put(word, entry)
+        return entry
+
+    def _set_lemmas(self, rname: str, lemmas: frozenset,
+                    settled: dict[frozenset, str]) -> None:
+        """Move one role to a new lemma set, updating dots on the flipped dims.
+
+        `settled` maps lemma sets to a role already moved to them in this
+        pass, whose sum and sign are reused instead of recomputed.
+        """
+        old = self._role_lemmas[rname]
+        if lemmas == old:
+            settled.setdefault(lemmas, rname)
+            return
+        self._role_lemmas[rname] = lemmas
+        source = settled.get(lemmas)
+        if source is not None:
+            self._sums[rname] = self._sums[source].copy()
+            value = self._values[source]
+        else:
+            settled[lemmas] = rname
+            total = self._sums[rname]
+            for lemma in old - lemmas:
+                total -= self._lemma_vecs[lemma]
+            for lemma in lemmas - old:
+                total += self._lemma_vecs[lemma]
+            value = np.where(total >= 0, 1, -1).astype(np.int16) if lemmas else self._empty
+
+        flipped = np.flatnonzero(value != self._values[rname])
+        if len(flipped):
+            # A sign flip touches one row of the transposed role matrix.
+            step = (value[flipped] - self._values[rname][flipped]) * self._role_syms[rname][flipped]
+            columns = self.index.role_columns(rname)
+            self._dots[rname] += step.astype(np.float32) @ columns[flipped]
+        self._values[rname] = value
+
+    # -- Scoring --------------------------------------------------------------
+
+    def _cos_for_value(self, rname: str, value: str) -> np.ndarray:
+        key = (rname, value)
+        cos = self._value_cos.get(key)
+        if cos is None:
+            q   = self.codebook.role_vector(rname, value).astype(np.float32)
+            cos = self._value_cos[key] = self.index._role_cos(rname, q)
+        return cos
+
+    def category_counts(self) -> dict[str, int]:
+        """Category signal hits of the current input."""
+        text, counts = self._category
+        if text != self.text or not counts:
+            counts = _category_signal_counts(self.text.lower())
+            self._category = (self.text, counts)
+        return counts
+
+    def category(self) -> tuple[str, bool]:
+        """(inferred category, has_category_signal) of the current input."""
+        counts = self.category_counts()
+        return _best_category(counts), any(counts.values())
+
+    def scores(self) -> np.ndarray:
+        """Pattern A score of every entry for the current input."""
+        self._sync()
+        attributes = {"category": self.category()[0], "answer": ""}
+        weighted = np.zeros(len(self.index), dtype=np.float64)
+        for rname, w in self.index.role_weights.items():
+            if rname in self._dots:
+                cos = self._dots[rname] / self.dimension
+            else:
+                cos = self._cos_for_value(rname, attributes.get(rname, ""))
+            weighted += cos * w
+        return weighted / sum(self.index.role_weights.values())
+
+    def results(self, top_k: int | None = None) -> list[tuple[float, dict[str, Any]]]:
+        """The top_k (score, metadata) pairs for the current input, best-first."""
+        self._sync()
+        k   = self.index.top_k if top_k is None else top_k
+        key = (self._state, self.text, k)
+        if self._last is not None and self._last[0] == key:
+            return list(self._last[1])
+        scores = self.scores()
+        scope  = self.index.live_rows()
+        if self.index.route:
+            cats = route_categories(self.category_counts(), self.index.route_margin)
+            part = self.index.partitions_of(cats)
+            if part is not None and len(part) and scores[part].max() >= self.index.route_threshold:
+                scope = part
+        ranked = self.index._ranked(scores[scope], scope, k)
+        self._last = (key, ranked)
+        return list(ranked)
+
+    def type(self, text: str, top_k: int | None = None,
+             complete: bool = False) -> list[tuple[float, dict[str, Any]]]:
+        """update(text, complete) then results(): one keystroke."""
+        self.update(text, complete)
+        return self.results(top_k)
+
+
+# ---------------------------------------------------------------------------
+# Per-keystroke latency
+# ---------------------------------------------------------------------------
+
+def typeahead_report(index, queries: list[str], k: int = 3) -> dict:
+    """Mean per-keystroke latency of a TypeaheadSession vs search() per prefix.
+
+    Every query is typed one character at a time into a fresh session, the
+    last keystroke with complete=True; search() runs on every full prefix.
+    `agreement` is the share of keystrokes whose top-k matches search() on
+    the text the session scored, and `speedup` is search_mean_ms over
+    session_mean_ms.
+    """
+    session_ms = search_ms = 0.0
+    keystrokes = agree = 0
+    for query in queries:
+        session = TypeaheadSession(index)
+        for end in range(1, len(query) + 1):
+            prefix   = query[:end]
+            complete = end == len(query)
+            start  = time.perf_counter()
+            got    = session.type(prefix, k, complete)
+            mid    = time.perf_counter()
+            index.search(prefix, top_k=k)
+            session_ms += (mid - start) * 1000
+            search_ms  += (time.perf_counter() - mid) * 1000
+            keystrokes += 1
+            want   = index.search(prefix if complete else committed_prefix(prefix), top_k=k)
+            agree += [m["question_id"] for _, m in got] == [m["question_id"] for _, m in want]
+    return {
+        "keystrokes":         keystrokes,
+        "agreement":          agree / keystrokes if keystrokes else 1.0,
+        "session_mean_ms":    session_ms / keystrokes if keystrokes else 0.0,
+        "search_mean_ms":     search_ms / keystrokes if keystrokes else 0.0,
+        "speedup":            search_ms / session_ms if session_ms else 0.0,
+    }